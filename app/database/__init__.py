@@ -1,5 +1 @@
-from sqlalchemy.orm import sessionmaker, scoped_session
-from . import models
-
-Session = sessionmaker(bind=models.engine)
-session = scoped_session(Session)
\ No newline at end of file
+from .store import ChunkStore, MemoryChunkStore, SqliteChunkStore, RegionChunkStore, make_store
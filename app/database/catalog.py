@@ -0,0 +1,55 @@
+"""
+In-memory index of which chunks exist in the database
+"""
+import threading
+
+from app.database import models
+from app.system.utils import Coord
+
+
+class ChunkCatalog:
+    """
+    Maps chunk coordinates to models.Chunk ids. The whole table is read
+    through session once on first use and kept up to date by the writes
+    that insert chunks, so checking whether a chunk exists never needs a
+    query.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.ids = None
+        # Chunks written before the catalog is first read; the persister
+        # adds them from its own thread, where reading the table would
+        # race with its uncommitted writes
+        self.added = {}
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.ids is None:
+                self.ids = {Coord(x, y): id for id, x, y in
+                            self.session.query(models.Chunk.id, models.Chunk.x, models.Chunk.y)}
+                self.ids.update(self.added)
+                self.added.clear()
+        return self.ids
+
+    def get(self, x, y):
+        return self.load().get(Coord(x, y))
+
+    def add(self, x, y, id):
+        with self.lock:
+            if self.ids is None:
+                self.added[Coord(x, y)] = id
+            else:
+                self.ids[Coord(x, y)] = id
+
+    def existing(self, coords):
+        ids = self.load()
+        return {Coord(*coord) for coord in coords if Coord(*coord) in ids}
+
+    def __contains__(self, coord):
+        return Coord(*coord) in self.load()
+
+    def __len__(self):
+        return len(self.load())
+
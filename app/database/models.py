@@ -1,15 +1,24 @@
-from sqlalchemy import Column, Integer, Float, String, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, Float, String, Boolean, ForeignKey, LargeBinary, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, backref
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect
+
+import config
 
 from app.system.utils import Coord
 
 
-engine = create_engine('sqlite:///db.sqlite')
 Base = declarative_base()
 
 
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in config.sqlite_pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+
 class Block(Base):
     __tablename__ = 'blocks'
     id = Column(Integer, primary_key=True)
@@ -19,7 +28,7 @@ class Block(Base):
     z = Column(Integer)
     foliage = Column(Integer)
 
-    chunk_id = Column(Integer, ForeignKey('chunks.id'))
+    chunk_id = Column(Integer, ForeignKey('chunks.id'), index=True)
 
     def __repr__(self):
       return '<Block id: %s, chunk: %s, coord: (%s,%s)>' % (self.id, 
@@ -30,14 +39,20 @@ class Block(Base):
 
 class Chunk(Base):
     __tablename__ = 'chunks'
+    # Chunks are only ever looked up by both coordinates
+    __table_args__ = (Index('ix_chunks_x_y', 'x', 'y', unique=True),)
     id = Column(Integer, primary_key=True)
-    x = Column(Integer, index=True)
-    y = Column(Integer, index=True)
+    x = Column(Integer)
+    y = Column(Integer)
     name = Column(String)
     temperature = Column(Float)
     precipitation = Column(Float)
     windspeed = Column(Float)
 
+    # Packed z and foliage grids (see app.database.packing); when set it
+    # replaces the chunk's rows in `blocks`
+    terrain = Column(LargeBinary)
+
     blocks = relationship('Block', backref='tile')
 
     n_id = Column(Integer, ForeignKey('chunks.id'))
@@ -83,4 +98,51 @@ class Chunk(Base):
         return '<Chunk id: %s, coord: (%s,%s)>' % (self.id, self.x, self.y)
 
 
-Base.metadata.create_all(engine)
\ No newline at end of file
+# Indexes older databases have that the tables no longer declare
+SUPERSEDED_INDEXES = {'chunks': ('ix_chunks_x', 'ix_chunks_y')}
+
+
+def remove_duplicate_chunks(engine):
+    """
+    Delete every chunk row but the first stored at its (x, y), the one
+    lookups found before (x, y) was unique, along with its block rows
+    """
+    with engine.begin() as connection:
+        duplicates = connection.execute(
+            'SELECT id, x, y FROM chunks WHERE id NOT IN '
+            '(SELECT MIN(id) FROM chunks GROUP BY x, y)').fetchall()
+        for id, x, y in duplicates:
+            print(f'Removing duplicate chunk row {id} at ({x}, {y})')
+            connection.execute('DELETE FROM blocks WHERE chunk_id = ?', id)
+            connection.execute('DELETE FROM chunks WHERE id = ?', id)
+    return len(duplicates)
+
+
+def upgrade_schema(engine):
+    # create_all only creates missing tables, so add columns and indexes
+    # that were introduced after a database was first created
+    inspector = inspect(engine)
+    columns = {column['name'] for column in inspector.get_columns('chunks')}
+    if 'terrain' not in columns:
+        engine.execute('ALTER TABLE chunks ADD COLUMN terrain BLOB')
+    for table in Base.metadata.sorted_tables:
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for name in SUPERSEDED_INDEXES.get(table.name, ()):
+            if name in indexes:
+                engine.execute(f'DROP INDEX {name}')
+        for index in table.indexes:
+            if index.name not in indexes:
+                if index.unique and table.name == 'chunks':
+                    remove_duplicate_chunks(engine)
+                index.create(engine)
+
+
+def create_db(url=config.database_url):
+    """
+    Engine for the database at url, creating or upgrading its tables
+    """
+    engine = create_engine(url)
+    event.listen(engine, 'connect', set_sqlite_pragmas)
+    Base.metadata.create_all(engine)
+    upgrade_schema(engine)
+    return engine
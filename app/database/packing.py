@@ -0,0 +1,36 @@
+"""
+Binary format for a chunk's terrain grids, as stored in models.Chunk.terrain
+
+    header: magic (4s), version (B), n_rows (H), n_cols (H), little endian
+    body:   zlib compressed z grid then foliage grid, int8, row major
+"""
+import struct
+import zlib
+
+import numpy as np
+
+from app.system.exceptions import TerrainFormatError
+
+
+MAGIC = b'TRRN'
+VERSION = 1
+HEADER = struct.Struct('<4sBHH')
+
+
+def pack_terrain(z_grid, foliage_grid):
+    z_grid = np.ascontiguousarray(z_grid, dtype=np.int8)
+    foliage_grid = np.ascontiguousarray(foliage_grid, dtype=np.int8)
+    n_rows, n_cols = z_grid.shape
+    return (HEADER.pack(MAGIC, VERSION, n_rows, n_cols) +
+            zlib.compress(z_grid.tobytes() + foliage_grid.tobytes()))
+
+
+def unpack_terrain(blob):
+    magic, version, n_rows, n_cols = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise TerrainFormatError(f'Not a packed terrain blob (magic {magic!r})')
+    if version != VERSION:
+        raise TerrainFormatError(f'Unsupported packed terrain version {version}')
+    grids = np.frombuffer(zlib.decompress(blob[HEADER.size:]), dtype=np.int8)
+    z_grid, foliage_grid = grids.reshape(2, n_rows, n_cols)
+    return z_grid, foliage_grid
@@ -0,0 +1,168 @@
+"""
+Write-behind persistence: saves are queued from the game loop and committed
+in batches on a dedicated thread with its own session
+"""
+import time
+import traceback
+from collections import deque
+
+import config
+from app.system.background import BackgroundWriter
+
+
+class Persister(BackgroundWriter):
+    """
+    Writes are callables taking a session from session_factory, queued
+    under a key. Queuing a key that is already waiting replaces its write,
+    so a chunk saved many times between commits is written once. Every
+    `interval` seconds the waiting writes are run in queue order and
+    committed together. Without a session_factory writes get None and there
+    is nothing to commit. A write may return a callable, which is called
+    once its changes have been committed and dropped if they are rolled back.
+    """
+
+    name = 'persister'
+
+    def __init__(self, session_factory=None, interval=config.persist_interval, history=100):
+        super().__init__()
+        self.session_factory = session_factory
+        self.interval = interval
+        self.session = None
+        self.pending = {}
+        self.in_flight = {}
+
+        self.commit_latencies = deque(maxlen=history)
+        self.commits = 0
+        self.writes = 0
+        self.coalesced = 0
+        self.errors = 0
+
+
+    def queue(self, key, write):
+        self.start()
+        with self.condition:
+            if key in self.pending:
+                self.coalesced += 1
+            self.pending[key] = write
+
+
+    def is_pending(self, key):
+        with self.condition:
+            return key in self.pending or key in self.in_flight
+
+
+    def queued(self, key):
+        """
+        The latest write queued under key that isn't committed yet, or None
+        """
+        with self.condition:
+            return self.pending.get(key) or self.in_flight.get(key)
+
+
+    @property
+    def queue_depth(self):
+        return len(self.pending)
+
+
+    @property
+    def commit_latency(self):
+        return self.commit_latencies[-1] if self.commit_latencies else 0.0
+
+
+    def stats(self):
+        latencies = self.commit_latencies
+        return {'queue_depth': self.queue_depth,
+                'commits': self.commits,
+                'writes': self.writes,
+                'coalesced': self.coalesced,
+                'errors': self.errors,
+                'commit_latency': self.commit_latency,
+                'mean_commit_latency': sum(latencies)/len(latencies) if latencies else 0.0,
+                'max_commit_latency': max(latencies, default=0.0)}
+
+
+    def loop(self):
+        self.session = self.session_factory() if self.session_factory else None
+        try:
+            super().loop()
+        finally:
+            if self.session is not None:
+                self.session.close()
+            self.session = None
+
+
+    def has_work(self):
+        return bool(self.pending)
+
+
+    def take(self):
+        writes, self.pending = self.pending, {}
+        self.in_flight = writes
+        return writes
+
+
+    def process(self, writes):
+        self.commit(self.session, writes)
+
+
+    def done(self, writes):
+        self.in_flight = {}
+
+
+    def idle(self):
+        return not self.pending and not self.in_flight
+
+
+    def commit(self, session, writes):
+        if not writes:
+            return
+        start = time.perf_counter()
+        try:
+            on_commits = [write(session) for write in writes.values()]
+            self.commit_session(session)
+        except Exception:
+            self.rollback_session(session)
+            # Retry one at a time so a single bad write doesn't lose the batch
+            for write in writes.values():
+                self.commit_one(session, write)
+            return
+        for on_commit in on_commits:
+            self.committed(on_commit)
+        self.commit_latencies.append(time.perf_counter() - start)
+        self.commits += 1
+        self.writes += len(writes)
+
+
+    def commit_one(self, session, write):
+        try:
+            on_commit = write(session)
+            self.commit_session(session)
+        except Exception:
+            self.rollback_session(session)
+            self.errors += 1
+            traceback.print_exc()
+        else:
+            self.committed(on_commit)
+            self.writes += 1
+
+
+    def committed(self, on_commit):
+        if on_commit is None:
+            return
+        try:
+            on_commit()
+        except Exception:
+            self.errors += 1
+            traceback.print_exc()
+
+
+    @staticmethod
+    def commit_session(session):
+        if session is not None:
+            session.commit()
+
+
+    @staticmethod
+    def rollback_session(session):
+        if session is not None:
+            session.rollback()
@@ -0,0 +1,266 @@
+"""
+Chunk terrain stored in region files, an alternative to the database
+
+Each file holds a REGION_SIZE x REGION_SIZE square of chunks:
+
+    header: magic (4s), version (B), padding to 16 bytes
+    table:  one (sector, n_sectors, length) entry of uint32s per chunk,
+            row major, n_sectors 0 for a chunk that isn't stored
+    body:   SECTOR sized sectors holding app.database.packing blobs
+
+A chunk is always written to free sectors before its table entry is
+pointed at them, so an interrupted write leaves the old copy in place.
+The sectors it used before are freed for reuse, and compact() rewrites a
+file without the gaps.
+
+Subclasses of RegionFile and RegionFiles can keep other per-chunk blobs
+in the same layout under their own magic, sector and region size.
+"""
+import mmap
+import os
+import struct
+import threading
+
+import numpy as np
+
+from app.database.packing import pack_terrain, unpack_terrain
+from app.system.exceptions import RegionFormatError
+from app.system.utils import Coord
+
+
+MAGIC = b'RGN1'
+VERSION = 1
+SECTOR = 512
+REGION_SIZE = 32
+HEADER = struct.Struct('<4sB11x')
+ENTRY = struct.Struct('<III')
+
+
+class RegionFile:
+    magic = MAGIC
+    version = VERSION
+    sector = SECTOR
+    region_size = REGION_SIZE
+
+    def __init__(self, path, create=False):
+        self.path = path
+        if not os.path.isfile(path):
+            if not create:
+                raise FileNotFoundError(path)
+            self.create(path)
+        self.open()
+
+    def open(self):
+        self.file = open(self.path, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        magic, version = HEADER.unpack_from(self.map)
+        if magic != self.magic:
+            raise RegionFormatError(f'{self.path} is not a {self.magic.decode()} file (magic {magic!r})')
+        if version != self.version:
+            raise RegionFormatError(f'{self.path} has unsupported version {version}')
+        # A copy, as numpy views would stop the map being closed to resize it
+        self.table = np.frombuffer(self.map, dtype='<u4', count=3*self.region_size**2,
+                                   offset=HEADER.size).reshape(-1, 3).copy()
+
+    @classmethod
+    def header_sectors(cls):
+        return -(-(HEADER.size + ENTRY.size*cls.region_size**2)//cls.sector)
+
+    @classmethod
+    def create(cls, path):
+        tmp_file = path + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(HEADER.pack(cls.magic, cls.version).ljust(cls.header_sectors()*cls.sector, b'\0'))
+        os.replace(tmp_file, path)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    @classmethod
+    def index(cls, x, y):
+        return (y % cls.region_size)*cls.region_size + x % cls.region_size
+
+    @property
+    def n_sectors(self):
+        return len(self.map)//self.sector
+
+    def read(self, x, y, length=None):
+        """
+        The blob stored for chunk (x, y), or just its first length bytes
+        """
+        sector, n_sectors, stored = self.table[self.index(x, y)]
+        if not n_sectors:
+            return None
+        start = int(sector)*self.sector
+        return self.map[start:start+min(int(stored), length or int(stored))]
+
+    def used_sectors(self):
+        # +1 where each stored chunk starts and -1 where it ends, so the
+        # running sum is non-zero over used sectors
+        live = self.table[self.table[:, 1] > 0].astype(np.int64)
+        edges = np.zeros(self.n_sectors + 1, dtype=np.int64)
+        np.add.at(edges, live[:, 0], 1)
+        np.add.at(edges, live[:, 0] + live[:, 1], -1)
+        used = np.cumsum(edges[:-1]) > 0
+        used[:self.header_sectors()] = True
+        return used
+
+    def allocate(self, n_sectors):
+        """
+        First run of n_sectors free sectors, growing the file if none fits
+        """
+        free = ~self.used_sectors()
+        run = 0
+        for sector in np.flatnonzero(free).tolist():
+            run = run + 1 if run and free[sector-1] else 1
+            if run == n_sectors:
+                return sector - n_sectors + 1
+        # Extend any free run at the end of the file rather than skip it
+        end = self.n_sectors
+        start = end - run if run and free[end-1] else end
+        self.resize(start + n_sectors)
+        return start
+
+    def resize(self, n_sectors):
+        self.map.close()
+        self.file.truncate(n_sectors*self.sector)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+    def write(self, x, y, blob):
+        n_sectors = -(-len(blob)//self.sector)
+        sector = self.allocate(n_sectors)
+        start = sector*self.sector
+        self.map[start:start+len(blob)] = blob
+        self.map.flush()
+        self.set_entry(self.index(x, y), sector, n_sectors, len(blob))
+
+    def delete(self, x, y):
+        self.set_entry(self.index(x, y), 0, 0, 0)
+
+    def set_entry(self, i, sector, n_sectors, length):
+        self.table[i] = sector, n_sectors, length
+        ENTRY.pack_into(self.map, HEADER.size + i*ENTRY.size, sector, n_sectors, length)
+        self.map.flush()
+
+    @property
+    def free_sectors(self):
+        return int(np.count_nonzero(~self.used_sectors()))
+
+    def indices(self):
+        return np.flatnonzero(self.table[:, 1]).tolist()
+
+    def compact(self):
+        """
+        Rewrite the file with its chunks back to back, returning the number
+        of sectors freed
+        """
+        before = self.n_sectors
+        tmp_file = self.path + '.tmp'
+        self.create(tmp_file)
+        with open(tmp_file, 'r+b') as f:
+            sector = self.header_sectors()
+            # Keep chunks in their current order on disk
+            for i in sorted(self.indices(), key=lambda i: self.table[i, 0]):
+                old_sector, n_sectors, length = (int(v) for v in self.table[i])
+                f.seek(sector*self.sector)
+                f.write(self.map[old_sector*self.sector:(old_sector+n_sectors)*self.sector])
+                f.seek(HEADER.size + i*ENTRY.size)
+                f.write(ENTRY.pack(sector, n_sectors, length))
+                sector += n_sectors
+            f.truncate(sector*self.sector)
+        self.close()
+        os.replace(tmp_file, self.path)
+        self.open()
+        return before - self.n_sectors
+
+
+class RegionFiles:
+    """
+    A directory of file_class files named {r_x}_{r_y}{extension}, safe to
+    use from a writer thread and the game loop at once
+    """
+    file_class = RegionFile
+    extension = '.region'
+
+    def __init__(self, root):
+        self.root = root
+        self.regions = {}
+        self.lock = threading.RLock()
+
+    def region_file(self, r_x, r_y):
+        return os.path.join(self.root, f'{r_x}_{r_y}{self.extension}')
+
+    def region(self, x, y, create=False):
+        size = self.file_class.region_size
+        r_coord = (x//size, y//size)
+        region = self.regions.get(r_coord)
+        if region is None:
+            region_file = self.region_file(*r_coord)
+            if not create and not os.path.isfile(region_file):
+                return None
+            os.makedirs(self.root, exist_ok=True)
+            region = self.regions[r_coord] = self.file_class(region_file, create=True)
+        return region
+
+    def read(self, x, y, length=None):
+        with self.lock:
+            region = self.region(x, y)
+            return region.read(x, y, length) if region is not None else None
+
+    def write(self, x, y, blob):
+        with self.lock:
+            self.region(x, y, create=True).write(x, y, blob)
+
+    def delete(self, x, y):
+        with self.lock:
+            region = self.region(x, y)
+            if region is not None:
+                region.delete(x, y)
+
+    def __contains__(self, coord):
+        with self.lock:
+            region = self.region(*coord)
+            return region is not None and bool(region.table[region.index(*coord), 1])
+
+    def all_regions(self):
+        if not os.path.isdir(self.root):
+            return {}
+        size = self.file_class.region_size
+        for entry in os.listdir(self.root):
+            if entry.endswith(self.extension):
+                r_x, r_y = (int(i) for i in entry[:-len(self.extension)].split('_'))
+                self.region(r_x*size, r_y*size)
+        return self.regions
+
+    def coords(self):
+        size = self.file_class.region_size
+        with self.lock:
+            return [Coord(r_x*size + i % size, r_y*size + i//size)
+                    for (r_x, r_y), region in self.all_regions().items()
+                    for i in region.indices()]
+
+    def compact(self):
+        with self.lock:
+            return sum(region.compact() for region in self.all_regions().values())
+
+    def close(self):
+        with self.lock:
+            for region in self.regions.values():
+                region.close()
+            self.regions.clear()
+
+
+class RegionStore(RegionFiles):
+    """
+    Chunk terrain in a directory of region files named {r_x}_{r_y}.region
+    """
+
+    def load(self, x, y):
+        blob = self.read(x, y)
+        if blob is None:
+            return None
+        return unpack_terrain(blob)
+
+    def save(self, x, y, z_grid, foliage_grid):
+        self.write(x, y, pack_terrain(z_grid, foliage_grid))
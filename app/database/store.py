@@ -0,0 +1,302 @@
+"""
+Where chunk terrain is kept between loads
+
+A ChunkStore holds each chunk's z and foliage grids by chunk coordinate.
+World picks one from config.chunk_backend unless it is given one, and
+Chunk and Block only ever go through world.store.
+"""
+from abc import ABC, abstractmethod
+from functools import partial
+
+import numpy as np
+from sqlalchemy import and_, bindparam, select
+from sqlalchemy.orm import sessionmaker, scoped_session
+
+import config
+from app.database import models
+from app.database.catalog import ChunkCatalog
+from app.database.packing import pack_terrain, unpack_terrain
+from app.database.persister import Persister
+from app.database.region import RegionStore
+from app.system.exceptions import NoDatabaseModel
+from app.system.utils import Coord
+
+
+class ChunkStore(ABC):
+    # Whether chunks are kept on disk, see app.system.tile_cache.make_tile_cache
+    on_disk = True
+
+    @abstractmethod
+    def load(self, x, y):
+        """
+        (z_grid, foliage_grid) of the stored chunk, or None
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def save(self, x, y, name, z_grid, foliage_grid):
+        raise NotImplementedError
+
+    @abstractmethod
+    def existing(self, coords):
+        """
+        The coords, as Coords, of chunks in the store
+        """
+        raise NotImplementedError
+
+    def __contains__(self, coord):
+        return bool(self.existing([coord]))
+
+    @abstractmethod
+    def coords(self):
+        """
+        The coords, as Coords, of every chunk in the store
+        """
+        raise NotImplementedError
+
+    def locate_block(self, id):
+        """
+        (chunk x, chunk y, row, col) of the block stored with this id, for
+        stores that keep blocks individually
+        """
+        return None
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class MemoryChunkStore(ChunkStore):
+    """
+    Keeps chunks in a dict for the life of the process, for benchmarks and
+    simulations that shouldn't touch the disk
+    """
+    on_disk = False
+
+    def __init__(self):
+        self.chunks = {}
+
+    def load(self, x, y):
+        stored = self.chunks.get(Coord(x, y))
+        if stored is None:
+            return None
+        z_grid, foliage_grid = stored
+        return z_grid.copy(), foliage_grid.copy()
+
+    def save(self, x, y, name, z_grid, foliage_grid):
+        self.chunks[Coord(x, y)] = (np.array(z_grid, dtype=np.int8),
+                                    np.array(foliage_grid, dtype=np.int8))
+
+    def existing(self, coords):
+        return {Coord(*coord) for coord in coords if Coord(*coord) in self.chunks}
+
+    def coords(self):
+        return list(self.chunks)
+
+
+class WriteBehindStore(ChunkStore):
+    """
+    Saves snapshot the grids and are written later by a Persister on its
+    own thread. Loads of a chunk that is still queued get its snapshot.
+    """
+
+    def __init__(self, session_factory=None):
+        self.persister = Persister(session_factory)
+
+    @abstractmethod
+    def read(self, x, y):
+        raise NotImplementedError
+
+    @abstractmethod
+    def write(self, session, x, y, name, z_grid, foliage_grid):
+        """
+        Run on the persister's thread, may return a callable to be called
+        once the write is committed
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def stored(self, coords):
+        raise NotImplementedError
+
+    @abstractmethod
+    def all_stored(self):
+        raise NotImplementedError
+
+    def load(self, x, y):
+        write = self.persister.queued(Coord(x, y))
+        if write is not None:
+            # Loaded again before its save was committed
+            return write.keywords['z_grid'].copy(), write.keywords['foliage_grid'].copy()
+        return self.read(x, y)
+
+    def save(self, x, y, name, z_grid, foliage_grid):
+        self.persister.queue(Coord(x, y),
+                             partial(self.write, x=x, y=y, name=name,
+                                     z_grid=np.array(z_grid, dtype=np.int8),
+                                     foliage_grid=np.array(foliage_grid, dtype=np.int8)))
+
+    def existing(self, coords):
+        coords = {Coord(*coord) for coord in coords}
+        return self.stored(coords) | {coord for coord in coords
+                                      if self.persister.is_pending(coord)}
+
+    def coords(self):
+        self.persister.flush()
+        return self.all_stored()
+
+    def flush(self):
+        self.persister.flush()
+
+    def close(self):
+        self.persister.stop()
+
+
+class SqliteChunkStore(WriteBehindStore):
+    """
+    Chunks in the models tables, as a packed terrain blob or as one
+    models.Block row per block depending on config.chunk_storage
+    """
+
+    def __init__(self, url=config.database_url):
+        self.engine = models.create_db(url)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = scoped_session(self.Session)
+        self.catalog = ChunkCatalog(self.session)
+        super().__init__(self.Session)
+
+    def read(self, x, y):
+        chunk_id = self.catalog.get(x, y)
+        if chunk_id is None:
+            return None
+        # The persister writes through its own session, so don't trust
+        # whatever this session already holds for the row
+        db_obj = self.session.query(models.Chunk).populate_existing().get(chunk_id)
+        if db_obj is None:
+            return None
+        if db_obj.terrain is not None:
+            return unpack_terrain(db_obj.terrain)
+        return self.read_block_rows(self.session, db_obj.id)
+
+    @staticmethod
+    def read_block_rows(session, chunk_id):
+        blocks = models.Block.__table__
+        block_rows = session.execute(
+            select([blocks.c.x, blocks.c.y, blocks.c.z, blocks.c.foliage])
+            .where(blocks.c.chunk_id == chunk_id)
+        ).fetchall()
+        x, y, z, foliage = np.array(block_rows, dtype=int).reshape(-1, 4).T
+
+        shape = (config.window_height//config.block_height,
+                 config.window_width//config.block_width)
+        z_grid = np.zeros(shape, dtype=np.int8)
+        foliage_grid = np.zeros(shape, dtype=np.int8)
+        z_grid[y//config.block_height, x//config.block_width] = z
+        foliage_grid[y//config.block_height, x//config.block_width] = foliage
+        return z_grid, foliage_grid
+
+    def write(self, session, x, y, name, z_grid, foliage_grid):
+        db_obj = session.query(models.Chunk).filter_by(x=x, y=y).first()
+        if db_obj is None:
+            db_obj = models.Chunk(x=x, y=y)
+            session.add(db_obj)
+        db_obj.name = name
+        packed = config.chunk_storage == 'packed'
+        # Rows predate the blob if the chunk was stored as them before
+        had_rows = db_obj.id is not None and db_obj.terrain is None
+        db_obj.terrain = pack_terrain(z_grid, foliage_grid) if packed else None
+        # The chunk row needs its id before the block rows can reference it
+        session.flush()
+
+        if packed:
+            if had_rows:
+                blocks = models.Block.__table__
+                session.execute(blocks.delete().where(blocks.c.chunk_id == db_obj.id))
+        else:
+            self.write_block_rows(session, db_obj.id, z_grid, foliage_grid)
+        # Catalogued once committed, a rolled back row's id may be reused
+        return partial(self.catalog.add, x, y, db_obj.id)
+
+    @staticmethod
+    def write_block_rows(session, chunk_id, z_grid, foliage_grid):
+        rows, cols = np.indices(z_grid.shape)
+        block_rows = [{'b_chunk_id': chunk_id, 'b_x': x, 'b_y': y, 'b_z': z, 'b_foliage': f}
+                      for x, y, z, f in zip((cols*config.block_width).ravel().tolist(),
+                                            (rows*config.block_height).ravel().tolist(),
+                                            z_grid.ravel().tolist(),
+                                            foliage_grid.ravel().tolist())]
+
+        blocks = models.Block.__table__
+        has_blocks = session.query(models.Block.id).filter_by(chunk_id=chunk_id).first()
+        if has_blocks:
+            statement = blocks.update().where(
+                and_(blocks.c.chunk_id == bindparam('b_chunk_id'),
+                     blocks.c.x == bindparam('b_x'),
+                     blocks.c.y == bindparam('b_y'))
+            ).values(z=bindparam('b_z'), foliage=bindparam('b_foliage'))
+        else:
+            statement = blocks.insert().values(chunk_id=bindparam('b_chunk_id'),
+                                               x=bindparam('b_x'),
+                                               y=bindparam('b_y'),
+                                               z=bindparam('b_z'),
+                                               foliage=bindparam('b_foliage'))
+        session.execute(statement, block_rows)
+
+    def stored(self, coords):
+        return self.catalog.existing(coords)
+
+    def all_stored(self):
+        return [Coord(x, y) for x, y in self.session.query(models.Chunk.x, models.Chunk.y)]
+
+    def locate_block(self, id):
+        db_obj = self.session.query(models.Block).get(id)
+        if db_obj is None:
+            return None
+        if db_obj.tile is None:
+            raise NoDatabaseModel(f'Block {id} does not belong to a chunk')
+        return (db_obj.tile.x, db_obj.tile.y,
+                db_obj.y//config.block_height, db_obj.x//config.block_width)
+
+    def close(self):
+        super().close()
+        self.session.remove()
+        self.engine.dispose()
+
+
+class RegionChunkStore(WriteBehindStore):
+    """
+    Chunks in app.database.region files
+    """
+
+    def __init__(self, root=config.region_dir):
+        self.regions = RegionStore(root)
+        super().__init__()
+
+    def read(self, x, y):
+        return self.regions.load(x, y)
+
+    def write(self, session, x, y, name, z_grid, foliage_grid):
+        self.regions.save(x, y, z_grid, foliage_grid)
+
+    def stored(self, coords):
+        return {coord for coord in coords if coord in self.regions}
+
+    def all_stored(self):
+        return self.regions.coords()
+
+    def close(self):
+        super().close()
+        self.regions.close()
+
+
+BACKENDS = {
+    'sqlite': SqliteChunkStore,
+    'region': RegionChunkStore,
+    'memory': MemoryChunkStore,
+}
+
+
+def make_store(backend=config.chunk_backend):
+    return BACKENDS[backend]()
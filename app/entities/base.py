@@ -4,7 +4,57 @@ from collections import namedtuple
 from app.system.utils import Coord, Rect
 
 
-class Entity():
+class EntitySchema(type):
+    """
+    Compiles an entity class's `defaults`, `attributes` and `overwrite`
+    declarations, once per class, into __slots__ and a generated __init__
+    that takes them as keyword arguments and assigns them in a straight line.
+    Keyword arguments outside the schema are passed on to init(). Attributes
+    an entity sets for itself (sprites, images...) are declared in `slots`.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        def lookup(key, default):
+            if key in namespace:
+                return namespace[key]
+            return getattr(bases[0], key, default) if bases else default
+
+        defaults = {**lookup('_Entity__defaults', {}), **lookup('defaults', {})}
+        attributes = {**lookup('attributes', {}), **lookup('overwrite', {})}
+
+        inherited = {slot for base in bases for klass in base.__mro__
+                          for slot in getattr(klass, '__slots__', ())}
+        names = [*defaults, 'prev_coord', *attributes, *namespace.get('slots', ())]
+        namespace['__slots__'] = tuple(attr for attr in dict.fromkeys(names)
+                                       if attr not in inherited)
+
+        cls = super().__new__(mcs, name, bases, namespace)
+        if '__init__' not in namespace:
+            cls.__init__ = mcs.compile_init(cls, defaults, attributes)
+        return cls
+
+    @staticmethod
+    def compile_init(cls, defaults, attributes):
+        # Schema attributes become keyword parameters so binding them happens
+        # in the interpreter's call machinery; init() gets the rest
+        schema = {**defaults, **attributes}
+        values = {f'_default_{attr}': default for attr, default in schema.items()}
+        params = [f'{attr}=_default_{attr}' for attr in schema]
+
+        lines = [f'def __init__(self, *, {", ".join(params)}, **kwargs):']
+        lines += [f'    self.{attr} = {attr}' for attr in defaults if attr not in attributes]
+        lines.append('    self.prev_coord = Coord(x, y)')
+        lines += [f'    self.{attr} = {attr}' for attr in attributes]
+        lines.append('    self.init(**kwargs)')
+
+        namespace = {'Coord': Coord, **values}
+        exec('\n'.join(lines), namespace)
+        __init__ = namespace['__init__']
+        __init__.__qualname__ = f'{cls.__qualname__}.__init__'
+        return __init__
+
+
+class Entity(metaclass=EntitySchema):
     __defaults = {
         'active': True,
         'render': True,
@@ -33,18 +83,12 @@ class Entity():
     attributes = {
     }
 
+    # Overwrite to update attribute values
+    overwrite = {
+    }
 
-    def __init__(self, **kwargs):
-        defaults = {**self.__defaults, **self.defaults}
-        for attr, default in defaults.items():
-            setattr(self, attr, kwargs.get(attr, default))
-    
-        self.prev_coord = Coord(self.x, self.y)    
-
-        for attr, default in self.attributes.items():
-            setattr(self, attr, kwargs.get(attr, default))
-
-        self.init(**kwargs)
+    # Any other instance attributes the class sets
+    slots = ()
 
 
     def init(self, **kwargs):
@@ -83,10 +127,10 @@ class Entity():
 
 
     def collides_with(self, entity):
-        r1 = self.rect
-        r2 = entity.rect
-
-        if (r1.x1 >= r2.x2) or (r1.x2 <= r2.x1) or (r1.y1 >= r2.y2) or (r1.y2 <= r2.y1):
+        # Compared in place rather than through rect, as this runs for every
+        # candidate pair every tick
+        if (self.x >= entity.x + entity.width) or (self.x + self.width <= entity.x) or \
+           (self.y >= entity.y + entity.height) or (self.y + self.height <= entity.y):
             return False
         return True
 
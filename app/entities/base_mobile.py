@@ -47,9 +47,8 @@ class MobileEntity(Entity):
     overwrite = {
     }
 
-    def __init__(self, **kwargs):
-        self.pre_init(**kwargs)
-        super(MobileEntity, self).__init__(**kwargs)
+    slots = ('in_combat_with', 'image', 'sprite', 'hp_image', 'hp_sprite', 'stats',
+             'cursor_coord')
 
 
     def init(self, **kwargs):
@@ -70,10 +69,6 @@ class MobileEntity(Entity):
         self.post_init(**kwargs)
 
 
-    def pre_init(self, **kwargs):
-        self.attributes = {**self.attributes, **self.overwrite}
-
-
     def post_init(self, **kwargs):
         pass
 
@@ -1,14 +1,13 @@
-import os
 import statistics
+import numpy as np
 from random import randint
-from numpy.random import normal, choice
-from PIL import Image, ImageDraw
+from numpy.random import normal
+from PIL import ImageDraw
 
 import config
-from app.database import session, models
-from app.system.utils import (compass_points, compass_opposite, compass_coord_mod, RGB,
-    env_bound, color_bound)
-from app.system.exceptions import NoDatabaseModel, DirectionMismatch
+from app.system.decals import block_rng, decals
+from app.system.utils import (compass_points, compass_coord_mod, RGB, env_bound,
+    color_bound)
 
 BLOCK_ENV_PARAMS = {
     'z': (-100, 100),
@@ -17,24 +16,88 @@ BLOCK_ENV_PARAMS = {
 
 NOOB_WALL = 100
 
+
+def block_colors(z_grid):
+    """
+    (..., 3) array of block fill colors for a grid of z values
+    """
+    z = np.asarray(z_grid, dtype=np.int16)
+    water = z < config.sea_level
+    sand = ~water & (z < config.sand_level)
+    snow = ~water & ~sand & (z > config.snow_level)
+    conditions = [water, sand, snow]
+    r = np.select(conditions, [np.minimum(50 + z*10, 255), 255, 204], np.minimum(20 + z, 255))
+    g = np.select(conditions, [np.minimum(150 + z*10, 255), 255, 229], np.minimum(90 + z, 255))
+    b = np.select(conditions, [255, 155, 255], np.minimum(20 + z, 255))
+    return np.stack([r, g, b], axis=-1).astype(np.int16)
+
+
+def block_collidable(z_grid):
+    return np.asarray(z_grid) > NOOB_WALL
+
+
+def foliage_density(z_grid, foliage_grid):
+    """
+    Upper bound of the number of foliage decals drawn on each block
+    """
+    z = np.asarray(z_grid, dtype=np.float64)
+    z_mod = np.where(z < config.sea_level, z**3, z**2)/100
+    foliage = np.asarray(foliage_grid, dtype=np.float64)
+    density = np.floor(np.maximum(0, (foliage + 100)/2 - np.abs(z_mod)))
+    return density.astype(np.int16)
+
+
+def block_outlines(z_grid, color_grid, w_z=None, s_z=None):
+    """
+    (..., 3) array of block outline colors, shaded darker the higher a block
+    stands over the mean of its west and south neighbours. w_z and s_z are
+    the z values west of column 0 and south of row 0, None where that chunk
+    isn't loaded.
+    """
+    z = np.asarray(z_grid, dtype=np.int16)
+    rows, cols = z.shape
+    # One extra row and column of neighbours below and to the left
+    padded = np.zeros((rows+1, cols+1), dtype=np.int16)
+    known = np.zeros((rows+1, cols+1), dtype=bool)
+    padded[1:, 1:] = z
+    known[1:, 1:] = True
+    if w_z is not None:
+        padded[1:, 0] = w_z
+        known[1:, 0] = True
+    if s_z is not None:
+        padded[0, 1:] = s_z
+        known[0, 1:] = True
+
+    w, w_known = padded[1:, :-1], known[1:, :-1]
+    s, s_known = padded[:-1, 1:], known[:-1, 1:]
+    n_adj = w_known.astype(np.int16) + s_known
+    adj_sum = np.where(w_known, w, 0) + np.where(s_known, s, 0)
+    # Floor of the mean, as statistics.mean(...)//1
+    height_diff = np.where(n_adj > 0, z - adj_sum//np.maximum(n_adj, 1), 0)
+    color_mod = np.where(height_diff > 0, -10*height_diff, 0)
+
+    outlines = np.clip(np.asarray(color_grid, dtype=np.int16) + color_mod[..., None], 0, 255)
+    outlines[block_collidable(z)] = (200, 0, 0)
+    return outlines.astype(np.uint8)
+
+
 class CompassPoint:
     def __init__(self, direction):
         self.direction = direction
-        self.block = None
+        self.offset = compass_coord_mod[direction]
     
-    def __get__(self, obj, objtype):
-        return getattr(obj, '_'+self.direction)
-    
-    def __set__(self, obj, other):
-        setattr(obj, '_'+self.direction, other)
-        if getattr(other, '_'+compass_opposite[self.direction]) is None:
-            setattr(other, '_'+compass_opposite[self.direction], obj)
-        #elif not getattr(other, '_'+compass_opposite[self.direction]) == obj:
-        #    raise DirectionMismatch(f'Direction mismatch between '
-        #                            f'{obj}->{self.direction}->{other}, {other}->{compass_opposite[self.direction]}->{getattr(other, compass_opposite[self.direction])}')
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return obj.chunk.neighbour_block(obj.row + self.offset.y, obj.col + self.offset.x)
 
 
 class Block:
+    """
+    View of one cell of a chunk's block arrays
+    """
+    __slots__ = ('chunk', 'row', 'col')
+
     n = CompassPoint('n')
     ne = CompassPoint('ne')
     e = CompassPoint('e')
@@ -44,96 +107,56 @@ class Block:
     w = CompassPoint('w')
     nw = CompassPoint('nw')
 
-    def __init__(self, x, y,
-                 **kwargs):
-        self.db_obj = None
-        self.x = x
-        self.y = y
-        
-        self.__init_env_params(**kwargs)
-        #self._mod_foliage()
-
-        self._set_color()
-        self._set_collidable()
-
-
-        self.width = config.block_width
-        self.height = config.block_height
-
-        self._n = None
-        self._ne = None
-        self._e = None
-        self._se = None
-        self._s = None
-        self._sw = None
-        self._w = None
-        self._nw = None
-
-
-    def __init_env_params(self, **kwargs):
-        for param in BLOCK_ENV_PARAMS:
-            setattr(self, param, kwargs.get(param, randint(-10, 10)))
-            setattr(self, param+'_dist_scale', kwargs.get(param+'_dist_scale', 3))
-
-    def _set_color(self):
-        if self.z < config.sea_level:
-            r = min(50 + self.z*10, 255)
-            g = min(150 + self.z*10, 255)
-            b = 255
-        elif self.z < config.sand_level:
-            r = 255
-            g = 255
-            b = 155
-        #elif self.z < config.grass_level:
-        #    r = min(0 + self.z, 255)
-        #    g = min(100 + self.z, 255)
-        #    b = min(0 + self.z, 255)
-
-        elif self.z > config.snow_level:
-            r = 204
-            g = 229
-            b = 255
-        
-        else:
-            r = min(20 + self.z, 255)
-            g = min(90 + self.z, 255)
-            b = min(20 + self.z, 255)
-        self.color = RGB(r, g, b)
+    width = config.block_width
+    height = config.block_height
+
+    def __init__(self, chunk, row, col):
+        self.chunk = chunk
+        self.row = row
+        self.col = col
+
+    @property
+    def x(self):
+        return self.col*config.block_width
+
+    @property
+    def y(self):
+        return self.row*config.block_height
+
+    @property
+    def z(self):
+        return int(self.chunk.z_grid[self.row, self.col])
+
+    @property
+    def foliage(self):
+        return int(self.chunk.foliage_grid[self.row, self.col])
 
-    def _set_collidable(self):
-        self.collidable = True if self.z > NOOB_WALL else False
+    @property
+    def color(self):
+        return RGB(*self.chunk.color_grid[self.row, self.col].tolist())
+
+    @property
+    def collidable(self):
+        return bool(self.chunk.collidable_grid[self.row, self.col])
 
     @property
     def _foliage(self):
-        if self.z < config.sea_level:
-            z_mod = (self.z**3)/100
-        else:
-            z_mod = (self.z**2)/100
-        return randint(0, max(0, (self.foliage+100)/2 - abs(z_mod))//1)
+        return randint(0, int(self.chunk.foliage_density_grid[self.row, self.col]))
 
     @staticmethod
     def load(id):
-        loaded_block = session.query(models.Block).get(id)
-        if loaded_block is None:
+        from app import world
+        from app.entities.chunk import Chunk
+        location = world.store.locate_block(id)
+        if location is None:
             return
-        return Block.load_from_db_obj(loaded_block)
+        x, y, row, col = location
+        return Chunk.load_stored(x, y).block(row, col)
 
-    @staticmethod
-    def load_from_db_obj(db_obj):
-        block = Block(**db_obj.__dict__)
-        block.db_obj = db_obj
-        return block
-
-    def save(self, commit=True):
-        if self.db_obj is None:
-            self.db_obj = models.Block()
-        self.db_obj.x = self.x
-        self.db_obj.y = self.y
-        for param in BLOCK_ENV_PARAMS:
-            setattr(self.db_obj, param, getattr(self, param))
-        session.add(self.db_obj)
-        if commit:
-            session.commit()
+    def save(self):
+        # A block's values live in its chunk's grids, so this queues the
+        # chunk's save, coalesced with any other saves of it before the commit
+        self.chunk.save()
 
     def get_env_params(self):
         return {param:getattr(self, param) for param in BLOCK_ENV_PARAMS}
@@ -199,46 +222,46 @@ class Block:
                            fill=self.color, 
                            outline=border_color)
 
-        for i in range(abs(self.z)//15*(1 if self.z < config.grass_level else 2)):
-            rock_image = Image.open('app/assets/rocks/'+
-                                    choice(os.listdir('app/assets/rocks')))
-            img.paste(rock_image,
-                      (randint(self.pil_coords[0], self.pil_coords[2]),
-                       randint(self.pil_coords[3], self.pil_coords[1])),
-                      rock_image)
-
-        if self.z > config.snow_level-15:
-            for i in range(15 - abs(config.snow_level-self.z)):
-                snow_image = Image.open('app/assets/snow/'+
-                                        choice(os.listdir('app/assets/snow')))
-                img.paste(snow_image,
-                          (randint(self.pil_coords[0], self.pil_coords[2]),
-                           randint(self.pil_coords[3], self.pil_coords[1])),
-                          snow_image)
-        
-        for i in range(self._foliage//10):
+        self.draw_decals(img)
+
+    def draw_decals(self, img, origin=(0, 0)):
+        """
+        Paste the block's decals onto img, whose top left corner is at
+        origin in the chunk image
+        """
+        rocks = abs(self.z)//15*(1 if self.z < config.grass_level else 2)
+        snow = max(0, 15 - abs(config.snow_level-self.z)) if self.z > config.snow_level-15 else 0
+        density = int(self.chunk.foliage_density_grid[self.row, self.col])
+        if not rocks and not snow and density < 10:
+            return
+
+        rng = block_rng(self.chunk.x, self.chunk.y, self.row, self.col)
+        left, top, right, bottom = self.pil_coords
+        x0, y0 = origin
+
+        def position():
+            return (rng.randint(left, right) - x0, rng.randint(bottom, top) - y0)
+
+        for i in range(rocks):
+            decals.paste(img, 'rocks', position(), rng)
+
+        for i in range(snow):
+            decals.paste(img, 'snow', position(), rng)
+
+        for i in range(rng.randint(0, density)//10):
             if self.z > config.sea_level and self.z < config.sand_level:
                 pass
             else:
-                if self.z < config.sea_level:
-                    img_dir = 'app/assets/underwater/'
-                else:
-                    img_dir = 'app/assets/foliage/'
-                grass_image = Image.open(img_dir+
-                                         choice(os.listdir(img_dir)))
-                img.paste(grass_image,
-                          (randint(self.pil_coords[0], self.pil_coords[2]),
-                           randint(self.pil_coords[3], self.pil_coords[1])),
-                          grass_image)
-            
-        
-        
-        
-        
+                kind = 'underwater' if self.z < config.sea_level else 'foliage'
+                decals.paste(img, kind, position(), rng)
 
 
     def __eq__(self, other):
-        return self.db_obj.id == other.db_obj.id
+        return (isinstance(other, Block) and self.chunk is other.chunk
+                and self.row == other.row and self.col == other.col)
+
+    def __hash__(self):
+        return hash((id(self.chunk), self.row, self.col))
 
     def __repr__(self):
         return f'<Block({self.x}, {self.y})>'
\ No newline at end of file
@@ -1,23 +1,32 @@
-import os
-import itertools
-import noise
 import numpy as np
 from collections import namedtuple
 from random import randint
 from PIL import Image, ImageDraw
 
 from pyglet.graphics import Batch, OrderedGroup
-from pyglet.image import load as load_image
+from pyglet.image import ImageData
 from pyglet.sprite import Sprite
 
 import config
 from app import world
-from app.database import session, models
-from app.entities.block import Block
+from app.entities.block import (Block, block_colors, block_collidable, block_outlines,
+    foliage_density)
 from app.entities.npc import NPC
 from app.entities.wall import Wall
-from app.system.exceptions import NoDatabaseModel, DirectionMismatch
-from app.system.utils import RGB, Coord, env_bound
+from app.system.exceptions import DirectionMismatch
+from app.system import terrain
+from app.system.chunk_images import encode_image, image_key, lower_edges, paste_pixels
+from app.system.decals import decals
+from app.system.spatial_hash import SpatialHash
+from app.system.utils import RGB, Coord
+from app.system.warm_cache import WarmChunk
+
+
+# Hydration stages, each including the ones before it
+HEADER = 0   # coordinates and name
+TERRAIN = 1  # block grids
+RENDER = 2   # background sprite
+LIVE = 3     # walls and NPCs
 
 
 class LazyChunkLoader:
@@ -37,7 +46,8 @@ class LazyChunkLoader:
             'nw': (obj.x-1, obj.y+1)
         }
         print(f'Loading chunk {dir_map[self.direction]}')
-        return world.load_chunk(*dir_map[self.direction], create=True)
+        # Whatever uses the neighbour hydrates it as far as it needs
+        return world.load_chunk(*dir_map[self.direction], create=True, stage=HEADER)
 
 
 class Chunk:
@@ -52,7 +62,6 @@ class Chunk:
 
 
     def __init__(self, x, y, name=None):
-        self.db_obj = None
         self.x = x
         self.y = y
         self.width = config.window_width
@@ -65,14 +74,30 @@ class Chunk:
         self.npcs = []
         self.walls = []
         self.objects = []
-        
+        # Collidable game objects, bucketed by position for update()
+        self.collidables = SpatialHash()
+
         self.sprite = None
+        self.baked = False
+        # Key of the image the sprite shows once any queued bakes are in
+        self.sprite_key = None
+        # The baked image the sprite shows, bottom row first, and its key
+        self.pixels = None
+        self.pixels_key = None
+        # (x, y, hp) of the NPCs to bring back instead of spawning new ones
+        self.npc_states = None
+        self.stage = HEADER
+        self._img_key = None
 
         self.name = name if name else \
                     f'{self.__class__.__name__}({self.x}, {self.y})'
      
-        self.grid = []
-        self.blocks = []
+        self.z_grid = np.zeros((self.n_rows, self.n_cols), dtype=np.int8)
+        self.foliage_grid = np.zeros((self.n_rows, self.n_cols), dtype=np.int8)
+        # int16 as the color rules go negative in deep water
+        self.color_grid = np.zeros((self.n_rows, self.n_cols, 3), dtype=np.int16)
+        self.collidable_grid = np.zeros((self.n_rows, self.n_cols), dtype=bool)
+        self.foliage_density_grid = np.zeros((self.n_rows, self.n_cols), dtype=np.int16)
 
         self.draw_batch = Batch()
         self.background = OrderedGroup(0)
@@ -93,194 +118,475 @@ class Chunk:
     @property
     def coord(self):
         return Coord(self.x, self.y)
+
+
+    def warm(self):
+        """
+        The chunk as the warm cache keeps it
+        """
+        pixels = self.pixels if self.baked else None
+        npcs = tuple((npc.x, npc.y, npc.stats.hp) for npc in self.npcs if not npc.dead)
+        return WarmChunk(self.x, self.y, self.name,
+                         np.array(self.z_grid, dtype=np.int8),
+                         np.array(self.foliage_grid, dtype=np.int8),
+                         self.pixels_key, pixels, npcs)
+
+
+    @staticmethod
+    def from_warm(warm):
+        chunk = Chunk(warm.x, warm.y, warm.name)
+        chunk.set_terrain(warm.z, warm.foliage)
+        # Only shown if the terrain and its neighbours still give this key
+        chunk.pixels, chunk.pixels_key = warm.pixels, warm.key
+        chunk.npc_states = warm.npcs
+        return chunk
+
+
+    def release(self):
+        # Drop the background and the NPCs' sprites now rather than
+        # whenever the chunk is collected
+        if self.sprite is not None:
+            self.sprite.delete()
+            self.sprite = None
+            self.baked = False
+            self.sprite_key = None
+        for npc in self.npcs:
+            npc.sprite.delete()
+            npc.hp_sprite.delete()
+        self.npcs.clear()
+        self.walls.clear()
+        self.objects.clear()
+        self.pixels = None
+        self.pixels_key = None
     
 
-    # TODO: num of loops over the blocks is too damn high!
-    def load_blocks(self):
-        if self.db_obj is None:
-            raise NoDatabaseObject
-        self.blocks = [Block.load_from_db_obj(block)
-                       for block in self.db_obj.blocks]
-        self.grid = np.array(sorted(self.blocks, 
-                                    key=lambda block:(block.y, block.x))).reshape(self.n_rows,
-                                                                                  self.n_cols)
-        self.link_blocks()
+    def block(self, row, col):
+        if 0 <= row < self.n_rows and 0 <= col < self.n_cols:
+            return Block(self, row, col)
+        return None
+
+
+    def loaded_neighbour(self, dx, dy):
+        # Unlike the LazyChunkLoader directions, never loads or creates a chunk
+        if not dx and not dy:
+            return self
+        coord = Coord(self.x+dx, self.y+dy)
+        return world.loaded_chunks.get(coord) or world.chunks_to_load.get(coord)
+
+
+    def neighbour_block(self, row, col):
+        """
+        Block at row, col of this chunk's grid extended across its borders,
+        or None if that falls in a chunk that isn't loaded
+        """
+        dy, row = divmod(row, self.n_rows)
+        dx, col = divmod(col, self.n_cols)
+        chunk = self.loaded_neighbour(dx, dy)
+        # A neighbour loaded only as far as its header may not be stored yet
+        if chunk is None or not chunk.hydrate(TERRAIN, create=False):
+            return None
+        return chunk.block(row, col)
+
+
+    @property
+    def blocks(self):
+        return [Block(self, row, col) for row in range(self.n_rows)
+                                      for col in range(self.n_cols)]
+
+
+    def set_terrain(self, z_grid, foliage_grid):
+        self.z_grid = np.array(z_grid, dtype=np.int8)
+        self.foliage_grid = np.array(foliage_grid, dtype=np.int8)
+        self.color_grid = block_colors(self.z_grid)
+        self.collidable_grid = block_collidable(self.z_grid)
+        self.foliage_density_grid = foliage_density(self.z_grid, self.foliage_grid)
+        self._img_key = None
+        self.stage = max(self.stage, TERRAIN)
+
 
     def set_walls(self):
         self.walls.clear()
-        for block in self.blocks:
-            if block.collidable:
-                wall = Wall(x=block.x,
-                            y=block.y,
-                            width=block.width,
-                            height=block.height,
-                            color=block.color,
-                            # Note: don't really need to draw these
-                            #color=(255,0,0),
-                            #batch=self.draw_batch
-                            )
-                self.objects.append(wall)
-
-
-    def link_blocks(self):
-        for r_i, row in enumerate(self.grid):
-            for b_i, block in enumerate(row):
-                if r_i != 0:
-                    block.s = self.grid[r_i-1][b_i]
-                    block.sw = self.grid[r_i-1][b_i-1]
-                    if b_i+1 != self.n_cols:
-                        block.se = self.grid[r_i-1][b_i+1]
-                if b_i != 0:
-                    block.w = self.grid[r_i][b_i-1]
+        for row, col in np.argwhere(self.collidable_grid).tolist():
+            block = self.block(row, col)
+            wall = Wall(x=block.x,
+                        y=block.y,
+                        width=block.width,
+                        height=block.height,
+                        color=block.color,
+                        # Note: don't really need to draw these
+                        #color=(255,0,0),
+                        #batch=self.draw_batch
+                        )
+            self.walls.append(wall)
 
 
     @staticmethod
-    def load(x, y, create=False):
-        loaded_chunk = session.query(models.Chunk).filter_by(x=x, y=y).first()
-
-        if loaded_chunk is None:
-            if create:
-                chunk = Chunk(x, y)
-                chunk.build_blocks()
-                chunk.save()
-            else:
-                return None
-        else:
-            chunk = Chunk.load_from_db_obj(loaded_chunk)
-
-        if not os.path.isfile(chunk.img_file):
-            chunk.build_img()
-        
-        bg_img = load_image(chunk.img_file)
-        chunk.sprite = Sprite(bg_img, 0, 0, 
-                              batch=chunk.draw_batch, 
-                              group=chunk.background)
-
-        chunk.set_walls()
-        chunk.add_npcs(5)
-        
+    def load(x, y, create=False, stage=LIVE):
+        if stage == HEADER and not create and (x, y) not in world.store:
+            return None
+        chunk = Chunk(x, y)
+        if not chunk.hydrate(stage, create):
+            return None
         return chunk
 
 
     @staticmethod
-    def load_from_db_obj(db_obj):
-        chunk = Chunk(x=db_obj.x,
-                      y=db_obj.y,
-                      name=db_obj.name)
-        
-        chunk.db_obj = db_obj
-        chunk.load_blocks()
+    def load_stored(x, y):
+        chunk = Chunk(x, y)
+        if not chunk.hydrate(TERRAIN, create=False):
+            return None
         return chunk
 
 
-    def save(self):
-        if self.db_obj is None:
-            self.db_obj = models.Chunk()
-        self.db_obj.x = self.x
-        self.db_obj.y = self.y
-        self.db_obj.name = self.name
+    def hydrate(self, stage=LIVE, create=True):
+        """
+        Run whichever stages up to `stage` the chunk hasn't been through.
+        False if the chunk isn't stored and create is False.
+        """
+        if self.stage < TERRAIN <= stage:
+            if not self.load_terrain(create):
+                return False
+        if self.stage < RENDER <= stage:
+            self.load_sprite()
+            self.stage = RENDER
+        if self.stage < LIVE <= stage:
+            self.set_walls()
+            if self.npc_states is not None:
+                self.restore_npcs(self.npc_states)
+                self.npc_states = None
+            else:
+                self.add_npcs(5)
+            self.stage = LIVE
+        return True
+
+
+    def load_terrain(self, create=True):
+        fields = world.store.load(self.x, self.y)
+        if fields is not None:
+            self.set_terrain(*fields)
+            return True
+        if not create:
+            return False
+        generated = None
+        if world.generator.is_pending(self.x, self.y):
+            generated = world.generator.result(self.x, self.y)
+        if generated is not None:
+            self.attach_generated(generated)
+        else:
+            self.build_blocks()
+            self.save()
+        return True
+
 
-        for block in self.blocks:
-            block.save(commit=False)
-            block.db_obj.chunk_id = self.db_obj.id
-            
-        session.add(self.db_obj)
-        session.commit()
+    def load_sprite(self):
+        pixels = self.stored_pixels()
+        if pixels is not None:
+            self.baked = True
+            self.pixels, self.pixels_key = pixels, self.img_key
+            bg_img = ImageData(self.width, self.height, 'RGB', pixels)
+        else:
+            # Shown until the bake comes back through World.attach_baked
+            bg_img = self.placeholder_img()
+            if not world.baker.is_pending(self.x, self.y):
+                world.baker.submit(self)
+
+        self.sprite_key = self.img_key
+        self.sprite = Sprite(bg_img, 0, 0, 
+                             batch=self.draw_batch, 
+                             group=self.background)
+        if not self.baked:
+            self.sprite.update(scale_x=self.width/self.n_cols,
+                               scale_y=self.height/self.n_rows)
+
+
+    def stored_pixels(self):
+        """
+        The baked image for the chunk's terrain, bottom row first, from the
+        chunk itself, the image writer if it isn't saved yet or the saved
+        images, or None
+        """
+        if self.pixels is not None and self.pixels_key == self.img_key:
+            return self.pixels
+        pixels = world.img_writer.pixels(self.img_key)
+        if pixels is None:
+            pixels = world.images.load(self.x, self.y, self.img_key)
+        return pixels
+
+
+    def placeholder_img(self):
+        # One pixel per block in its fill color, stretched over the chunk.
+        # pyglet rows run bottom up, as the grid rows do.
+        fills = np.clip(self.color_grid, 0, 255).astype(np.uint8)
+        return ImageData(self.n_cols, self.n_rows, 'RGB', fills.tobytes())
+
+
+    def attach_baked(self, baked):
+        # The PNG is only for the next time the chunk is loaded, the sprite
+        # takes the pixels as they came from the baker
+        if baked.box is None:
+            world.img_writer.write(self.x, self.y, baked.key, baked.img, baked.pixels)
+        else:
+            # The patch goes over the image it was re-rendered from, and
+            # the result is the image of the terrain it was rendered from
+            world.img_writer.patch(self.x, self.y, baked.key, baked.base, baked.box,
+                                   baked.pixels)
+
+        if self.sprite is None:
+            return
+        left, top, right, bottom = baked.box or (0, 0, self.width, self.height)
+        pixels = ImageData(right-left, bottom-top, 'RGB', baked.pixels)
+        if baked.box is None:
+            self.sprite.image = pixels
+            self.sprite.update(scale_x=1, scale_y=1)
+            self.baked = True
+            self.pixels, self.pixels_key = baked.pixels, baked.key
+        elif self.baked:
+            # Texture rows run bottom up
+            self.sprite.image.get_texture().blit_into(pixels, left, self.height-bottom, 0)
+            if self.pixels is not None and self.pixels_key == baked.base:
+                self.pixels = paste_pixels(self.pixels, baked.box, baked.pixels)
+                self.pixels_key = baked.key
+            else:
+                self.pixels = self.pixels_key = None
+
+
+    def set_blocks(self, cells, z=None, foliage=None):
+        """
+        Set the z and/or foliage of the blocks at cells, (row, col) pairs,
+        to a value or one per cell, then save the chunk and re-bake just the
+        part of the image they change
+        """
+        cells = list(cells)
+        if not cells:
+            return
+        rows, cols = np.array(cells, dtype=int).reshape(-1, 2).T
+        z_grid, foliage_grid = self.z_grid.copy(), self.foliage_grid.copy()
+        if z is not None:
+            z_grid[rows, cols] = np.clip(z, config.env_param_low_bound, config.env_param_high_bound)
+        if foliage is not None:
+            foliage_grid[rows, cols] = np.clip(foliage, config.env_param_low_bound,
+                                               config.env_param_high_bound)
+        self.set_terrain(z_grid, foliage_grid)
+        if self.stage >= LIVE:
+            self.set_walls()
+        self.save()
+        self.redraw_blocks(cells)
+
+
+    def redraw_blocks(self, cells):
+        """
+        Re-bake only the part of the image affected by the blocks at cells,
+        (row, col) pairs, after set_blocks changed them
+        """
+        cells = list(cells)
+        if not cells:
+            return
+        self.rebake(cells)
+
+        # The chunks east and north shade their border outlines against these
+        east = [(row, -1) for row, col in cells if col == self.n_cols-1]
+        north = [(-1, col) for row, col in cells if row == self.n_rows-1]
+        for dx, dy, edge_cells in ((1, 0, east), (0, 1, north)):
+            chunk = self.loaded_neighbour(dx, dy)
+            if edge_cells and chunk is not None:
+                chunk.rebake(edge_cells)
+
+
+    def rebake(self, cells):
+        """
+        Re-bake the part of the image the blocks at cells affect, cells one
+        row or column outside the chunk standing for a neighbour's border
+        """
+        self._img_key = None
+        # Unless it has a sprite the chunk is baked whole, under its new
+        # key, the next time it is shown
+        if self.sprite_key is not None and self.sprite_key != self.img_key:
+            world.baker.submit(self, self.dirty_box(cells), self.sprite_key)
+            self.sprite_key = self.img_key
+
+
+    def save(self):
+        world.store.save(self.x, self.y, self.name, self.z_grid, self.foliage_grid)
+        world.update_overview(self.x, self.y, self.z_grid)
 
 
     @property
-    def img_file(self):
-        return f'app/assets/chunks/{self.name}.png'
+    def img_key(self):
+        if self._img_key is None:
+            self._img_key = image_key(self.x, self.y, self.z_grid, self.foliage_grid,
+                                      self.lower_neighbour_z())
+        return self._img_key
 
 
     def gen_z_map(self):
-        shape = (config.window_width, config.window_height)
-        scale = 5000
-        octaves = 6
-        persistence = 0.4
-        lacunarity = 2.0
-        seed = config.map_seed
-
-        z_map = np.zeros(shape)
-
-        x_i = np.linspace(self.x*config.window_width,
-                          self.x*config.window_width + config.window_width - config.block_width,
-                          config.window_width//config.block_width).astype(int)
-        y_i = np.linspace(self.y*config.window_height,
-                          self.y*config.window_height + config.window_height - config.block_height,
-                          config.window_height//config.block_height).astype(int)
-
-        z_map_x, z_map_y = np.meshgrid(x_i, y_i)
-
-        z_map = np.vectorize(noise.pnoise2)(z_map_x/scale,
-                                            z_map_y/scale,
-                                            octaves=octaves,
-                                            persistence=persistence,
-                                            lacunarity=lacunarity,
-                                            repeatx=config.window_width,
-                                            repeaty=config.window_height,
-                                            base=config.map_seed)
-        return z_map*300
+        return terrain.gen_fields(terrain.x_axis(self.x, self.x),
+                                  terrain.y_axis(self.y, self.y),
+                                  scales=(terrain.Z_SCALE,))[0]
 
 
     def gen_foliage_map(self):
-        shape = (config.window_width, config.window_height)
-        scale = 10000
-        octaves = 6
-        persistence = 0.4
-        lacunarity = 2.0
-        seed = config.map_seed//2
-
-        z_map = np.zeros(shape)
-
-        x_i = np.linspace(self.x*config.window_width,
-                          self.x*config.window_width + config.window_width - config.block_width,
-                          config.window_width//config.block_width).astype(int)
-        y_i = np.linspace(self.y*config.window_height,
-                          self.y*config.window_height + config.window_height - config.block_height,
-                          config.window_height//config.block_height).astype(int)
-
-        z_map_x, z_map_y = np.meshgrid(x_i, y_i)
-
-        z_map = np.vectorize(noise.pnoise2)(z_map_x/scale,
-                                            z_map_y/scale,
-                                            octaves=octaves,
-                                            persistence=persistence,
-                                            lacunarity=lacunarity,
-                                            repeatx=config.window_width,
-                                            repeaty=config.window_height,
-                                            base=config.map_seed)
-        return z_map*300
+        return terrain.gen_fields(terrain.x_axis(self.x, self.x),
+                                  terrain.y_axis(self.y, self.y),
+                                  scales=(terrain.FOLIAGE_SCALE,))[0]
     
 
-    def build_blocks(self):
-        self.grid = []
-        n_rows = self.height//config.block_height
-        n_cols = self.width//config.block_width
-
-        z_map = self.gen_z_map()
-        foliage_map = self.gen_foliage_map()
-        for y_i in range(self.n_rows):
-            row = []
-            for x_i in range(self.n_cols):
-                new_block = Block(x=x_i*config.block_width, 
-                                  y=y_i*config.block_height,
-                                  z=env_bound(z_map[y_i][x_i]),
-                                  foliage=env_bound(foliage_map[y_i][x_i]))
-                row.append(new_block)
-            self.grid.append(row)
-        self.link_blocks()
+    def load_fields(self):
+        fields = world.tile_cache.get(self.x, self.y)
+        if fields is None:
+            fields = terrain.bound_fields(*terrain.gen_chunk_fields(self.x, self.y))
+            world.tile_cache.put(self.x, self.y, *fields)
+        return fields
+
+
+    def build_blocks(self, z_map=None, foliage_map=None):
+        if z_map is None or foliage_map is None:
+            z_map, foliage_map = self.load_fields()
+
+        self.set_terrain(*terrain.bound_fields(z_map, foliage_map))
+
+
+    @staticmethod
+    def generate_region(x0, y0, x1, y1, coords=None):
+        """
+        Create and save every chunk in x0..x1, y0..y1 (inclusive), or just
+        those of coords, that is not in the database yet, from one batched
+        terrain pass.
+        """
+        region = terrain.Region(x0, y0, x1, y1)
+        coords = region.coords if coords is None else [coord for coord in coords if coord in region]
+        existing = world.store.existing(coords)
+        chunks = []
+        for x, y in coords:
+            if (x, y) in existing:
+                continue
+            fields = terrain.bound_fields(*region.fields(x, y))
+            world.tile_cache.put(x, y, *fields)
+            chunk = Chunk(x, y)
+            chunk.build_blocks(*fields)
+            chunk.save()
+            chunks.append(chunk)
+        return chunks
+
+
+    @staticmethod
+    def from_generated(generated):
+        chunk = Chunk(generated.x, generated.y)
+        chunk.attach_generated(generated)
+        return chunk
+
+
+    def attach_generated(self, generated):
+        world.tile_cache.put(generated.x, generated.y, generated.z, generated.foliage)
+        self.build_blocks(generated.z, generated.foliage)
         self.save()
-        self.blocks = list(itertools.chain.from_iterable(self.grid))
+        if generated.key == self.img_key:
+            world.img_writer.write(self.x, self.y, self.img_key, generated.img)
+
+
+    def lower_neighbour_z(self):
+        """
+        z values along the west and south borders, from lower_edges with the
+        loaded or else stored neighbouring chunks' grids
+        """
+        grids = []
+        for dx, dy in ((-1, 0), (0, -1)):
+            chunk = self.loaded_neighbour(dx, dy)
+            if chunk is not None and chunk.hydrate(TERRAIN, create=False):
+                grids.append(chunk.z_grid)
+            else:
+                fields = world.store.load(self.x+dx, self.y+dy)
+                grids.append(fields[0] if fields is not None else None)
+        return lower_edges(self.x, self.y, *grids)
+
+
+    def render_base(self, box=None, edges=None):
+        """
+        (height, width, 3) uint8 array of the block fills and outlines, as
+        drawn by Block.img_draw for every block in turn. box limits it to
+        the (left, top, right, bottom) pixels of the image, edges are the
+        neighbours' z values from lower_neighbour_z.
+        """
+        left, top, right, bottom = box or (0, 0, self.width, self.height)
+        edges = self.lower_neighbour_z() if edges is None else edges
+        fills = np.clip(self.color_grid, 0, 255).astype(np.uint8)
+        outlines = block_outlines(self.z_grid, self.color_grid, *edges)
+
+        # Each block's rectangle spans block_width+1 pixels, so it shares its
+        # edges with its neighbours and the block drawn later (higher row,
+        # then higher col) owns them. Image rows run top down.
+        px = np.arange(left, right)
+        py = config.window_height - np.arange(top, bottom)
+        cols = np.minimum(px//config.block_width, self.n_cols-1)
+        rows = np.minimum(py//config.block_height, self.n_rows-1)
+        border_x = px == cols*config.block_width
+        border_y = (py == rows*config.block_height) | (py == (rows+1)*config.block_height)
+
+        pixels = fills.take(rows, axis=0).take(cols, axis=1)
+        pixels[border_y] = outlines.take(rows[border_y], axis=0).take(cols, axis=1)
+        pixels[:, border_x] = outlines.take(rows, axis=0).take(cols[border_x], axis=1)
+        return pixels
+
+
+    def decal_reach(self):
+        """
+        (left, top, right, bottom) arrays of the pixels each block's decals
+        can cover
+        """
+        decal_width, decal_height = decals.extent()
+        cols = np.arange(self.n_cols)*config.block_width
+        rows = config.window_height - np.arange(self.n_rows)*config.block_height
+        left = np.broadcast_to(cols, (self.n_rows, self.n_cols))
+        bottom = np.broadcast_to(rows[:, None], (self.n_rows, self.n_cols))
+        return (left, bottom-config.block_height,
+                left+config.block_width+decal_width, bottom+decal_height)
+
+
+    def render_pixels(self, box=None, edges=None):
+        # Bottom row first, as pyglet's ImageData takes them
+        return np.asarray(self.render_img(box, edges))[::-1].tobytes()
+
+
+    def render_img(self, box=None, edges=None):
+        left, top, right, bottom = box or (0, 0, self.width, self.height)
+        img = Image.fromarray(self.render_base(box, edges), mode='RGB')
+        # Decals go over the finished base, in the order the blocks were
+        # drawn, from the blocks that can reach the box
+        reach_left, reach_top, reach_right, reach_bottom = self.decal_reach()
+        in_box = ((reach_left < right) & (reach_right > left)
+                  & (reach_top < bottom) & (reach_bottom > top))
+        for row, col in np.argwhere(in_box).tolist():
+            Block(self, row, col).draw_decals(img, (left, top))
+        return img
+
+
+    def dirty_box(self, cells):
+        """
+        Pixel box of the image that changes when the blocks at cells,
+        (row, col) pairs, change z or foliage
+        """
+        rows, cols = np.array(list(cells), dtype=int).reshape(-1, 2).T
+        row0, row1 = rows.min(), rows.max()
+        col0, col1 = cols.min(), cols.max()
+        decal_width, decal_height = decals.extent()
+        # The blocks north and east shade their outlines against these
+        left = col0*config.block_width
+        top = config.window_height - (row1+2)*config.block_height
+        right = max((col1+2)*config.block_width + 1,
+                    (col1+1)*config.block_width + decal_width)
+        bottom = max(config.window_height - row0*config.block_height + 1,
+                     config.window_height - row0*config.block_height + decal_height)
+        return (int(max(left, 0)), int(max(top, 0)),
+                int(min(right, self.width)), int(min(bottom, self.height)))
+
+
+    def has_img(self):
+        return world.img_writer.is_pending(self.img_key) or \
+               world.images.has(self.x, self.y, self.img_key)
 
 
     def build_img(self):
-        img = Image.new(mode='RGB', 
-                        size=(self.width, self.height), 
-                        color=(255,255,255))
-        for block in self.blocks:
-            block.img_draw(img)
-        img.save(self.img_file)
+        img = encode_image(self.img_key, self.render_pixels())
+        world.images.save(self.x, self.y, self.img_key, img)
 
 
     def add_npcs(self, n):
@@ -293,16 +599,39 @@ class Chunk:
                       group=self.midground)
 
 
+    def restore_npcs(self, states):
+        for x, y, hp in states:
+            npc = NPC(chunk=self,
+                      x=x,
+                      y=y,
+                      width=50,
+                      height=50,
+                      group=self.midground)
+            npc.stats.hp = hp
+
+
+    def in_chunk(self, obj):
+        # Entities only leave a chunk in their own update, by dying or
+        # crossing into a neighbour, walls never do
+        return not obj.dead and getattr(obj, 'chunk', self) is self
+
+
     def update(self):
-        collision_checked = []
-        for obj in self.game_objects:
+        game_objects = self.game_objects
+        self.collidables.sync(obj for obj in game_objects if obj.collidable)
+        for obj in game_objects:
             obj.update()
+            if obj.collidable:
+                if self.in_chunk(obj):
+                    self.collidables.move(obj)
+                else:
+                    self.collidables.remove(obj)
             if obj.mobile:
-                for other_obj in self.game_objects:
-                    if other_obj is obj:
-                        pass
-                    elif other_obj.collidable:
-                        if obj.collides_with(other_obj):
-                            obj.on_collision(other_obj)
-                            other_obj.on_collision(obj)
-            collision_checked.append(obj)
+                for other_obj in self.collidables.near(obj):
+                    if other_obj is not obj and obj.collides_with(other_obj):
+                        obj.on_collision(other_obj)
+                        other_obj.on_collision(obj)
+                        # Either can be pushed out of the other
+                        self.collidables.move(other_obj)
+                        if obj.collidable:
+                            self.collidables.move(obj)
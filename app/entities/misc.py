@@ -17,6 +17,8 @@ class TemporaryEntity(Entity):
         'timer': 60
     }
 
+    slots = ('image', 'sprite')
+
     def init(self, **kwargs):
         self.image = load_image(self.image_file)
         self.sprite = Sprite(self.image, self.x, self.y,
@@ -24,6 +24,8 @@ class Player(MobileEntity):
         'chunk_container': 'players'
     }
 
+    slots = ('key_handler',)
+
 
     def post_init(self, **kwargs):
         self.key_handler = key.KeyStateHandler()
@@ -42,6 +44,7 @@ class Player(MobileEntity):
 
 
     def move_to_chunk(self, chunk):
+        chunk.hydrate()
         if self.chunk and self in self.chunk.players:
             self.chunk.players.remove(self)
         
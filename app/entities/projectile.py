@@ -20,12 +20,14 @@ class Projectile(Entity):
         'velocity_y': 0.0,
         'damage': 1
     }
+
+    slots = ('image', 'sprite')
     
     def init(self, **kwargs):
         self.image = pyglet.image.load('app/assets/projectiles/ball.png')
         self.sprite = pyglet.sprite.Sprite(self.image, self.x, self.y, 
-                                           batch=kwargs.get('batch', None),
-                                           group=kwargs.get('group', None))
+                                           batch=self.batch,
+                                           group=self.group)
 
 
     def check_bounds(self):
@@ -14,6 +14,8 @@ class Wall(Entity):
     attributes = {
         'color': RGB(255,255,255)
     }
+
+    slots = ('shape',)
     
     def init(self, **kwargs):
         self.shape = Rectangle(self.x, self.y,
@@ -1,21 +1,114 @@
 import config
-from app.database import session, models
+from app.database import make_store
+from app.system.baking import ChunkBakingService
+from app.system.chunk_images import ImageWriter, make_images
+from app.system.generation import ChunkGenerationService
+from app.system.overview import Overview
+from app.system.tile_cache import make_tile_cache
+from app.system.warm_cache import WarmChunkCache
 from app.system.window import Window
 from app.system.utils import Coord, distance
 
 
 class World:
 
-    def __init__(self):
+    def __init__(self, store=None, tile_cache=None):
+        self._store = store
+        self._tile_cache = tile_cache
         self.loaded_chunks = {}
+        self.warm_chunks = WarmChunkCache()
         self.chunks_to_load = {}
         self.chunks_to_unload = []
         self.players = []
+        self.prefetched = set()
+        self._generator = None
+        self._baker = None
+        self._images = None
+        self._img_writer = None
+        self._overview = None
 
 
-    def get_origin(self):
+    @property
+    def store(self):
+        # Made on first use so importing the game doesn't create a database
+        if self._store is None:
+            self._store = make_store(config.chunk_backend)
+        return self._store
+
+
+    @store.setter
+    def store(self, store):
+        if self._store is not None:
+            self._store.close()
+        self._store = store
+        # Paired with the new store when next used
+        self._tile_cache = None
+
+
+    @property
+    def tile_cache(self):
+        # On disk only for stores that are, see app.system.tile_cache
+        if self._tile_cache is None:
+            self._tile_cache = make_tile_cache(self.store)
+        return self._tile_cache
+
+
+    @tile_cache.setter
+    def tile_cache(self, tile_cache):
+        self._tile_cache = tile_cache
+
+
+    @property
+    def generator(self):
+        if self._generator is None:
+            self._generator = ChunkGenerationService(config.generation_workers,
+                                                     self.tile_cache.root)
+        return self._generator
+
+
+    @property
+    def baker(self):
+        if self._baker is None:
+            self._baker = ChunkBakingService(config.bake_workers)
+        return self._baker
+
+
+    @property
+    def images(self):
+        if self._images is None:
+            self._images = make_images(config.chunk_img_format)
+        return self._images
+
+
+    @property
+    def img_writer(self):
+        if self._img_writer is None:
+            self._img_writer = ImageWriter(self.images)
+        return self._img_writer
+
+
+    @property
+    def overview(self):
+        # Stored chunks are drawn in by update a few per tick, nearest the
+        # player first, and saved chunks by update_overview
+        if self._overview is None:
+            self._overview = Overview()
+            centre = self.players[0].chunk.coord if self.players else Coord(0, 0)
+            self._overview.queue(self.store.coords(), *centre)
+        return self._overview
+
+
+    def update_overview(self, x, y, z_grid):
+        if self._overview is not None:
+            self._overview.add(x, y, z_grid)
+
+
+    def get_origin(self, radius=config.prefetch_distance):
+        from app.entities.chunk import Chunk
         origin = self.loaded_chunks.get(Coord(0,0))
         if not origin:
+            # The spawn area in one batched terrain pass
+            Chunk.generate_region(-radius, -radius, radius, radius)
             origin = self.load_chunk(*Coord(0,0), create=True)
         return origin
 
@@ -41,17 +134,81 @@ class World:
         return player
 
 
-    def load_chunk(self, x, y, create=False):
-        from app.entities.chunk import Chunk
-        chunk = self.loaded_chunks.get(Coord(x,y))
+    def load_chunk(self, x, y, create=False, stage=None):
+        from app.entities.chunk import Chunk, LIVE
+        stage = LIVE if stage is None else stage
+        chunk = self.loaded_chunks.get(Coord(x,y)) or self.chunks_to_load.get(Coord(x,y))
         if chunk is not None:
+            chunk.hydrate(stage, create)
             return chunk
-        chunk = Chunk.load(x, y, create)
+        warm = self.warm_chunks.take(Coord(x, y))
+        if warm is not None:
+            chunk = Chunk.from_warm(warm)
+            chunk.hydrate(stage, create)
+        else:
+            chunk = Chunk.load(x, y, create, stage)
         self.chunks_to_load[Coord(x, y)] = chunk
         return chunk
+
+
+    def unload_chunk(self, chunk):
+        # Only the compact form is kept, the chunk and its entities go
+        from app.entities.chunk import TERRAIN
+        if chunk.stage >= TERRAIN:
+            self.warm_chunks.put(chunk.warm())
+        chunk.release()
+
+
+    def prefetch_chunks(self, x, y, radius=config.prefetch_distance):
+        coords = {Coord(x+dx, y+dy) for dx in range(-radius, radius+1)
+                                    for dy in range(-radius, radius+1)}
+        coords -= self.prefetched
+        if not coords:
+            return
+        self.prefetched.update(coords)
+        for coord in coords - self.store.existing(coords) - self.loaded_chunks.keys():
+            self.generator.submit(*coord)
+
+
+    def attach_generated(self):
+        from app.entities.chunk import Chunk
+        if self._generator is None:
+            return
+        for generated in self._generator.completed():
+            Chunk.from_generated(generated)
+
+
+    def attach_baked(self):
+        from app.entities.chunk import Chunk
+        if self._baker is None:
+            return
+        for baked in self._baker.completed():
+            coord = Coord(baked.x, baked.y)
+            chunk = self.loaded_chunks.get(coord) or self.chunks_to_load.get(coord) or Chunk(*coord)
+            chunk.attach_baked(baked)
+
+
+    def shutdown(self):
+        if self._generator is not None:
+            self._generator.shutdown()
+        if self._baker is not None:
+            self._baker.shutdown()
+        if self._img_writer is not None:
+            self._img_writer.stop()
+        if self._images is not None:
+            self._images.close()
+        if self._store is not None:
+            self._store.close()
         
 
     def update(self, dt):
+        self.attach_generated()
+        self.attach_baked()
+        if self._overview is not None:
+            self._overview.fill(self.store, config.overview_fill_rate)
+        for player in self.players:
+            self.prefetch_chunks(player.chunk.x, player.chunk.y)
+
         chunks_to_unload = []
         for chunk in self.loaded_chunks.values():
             players_near_chunk = []
@@ -65,6 +222,6 @@ class World:
                 chunks_to_unload.append(chunk.coord)
             else:
                 chunk.update()
-        [self.loaded_chunks.pop(coord) for coord in chunks_to_unload]
+        [self.unload_chunk(self.loaded_chunks.pop(coord)) for coord in chunks_to_unload]
         self.loaded_chunks.update(self.chunks_to_load)
         self.chunks_to_load.clear()
\ No newline at end of file
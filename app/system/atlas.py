@@ -0,0 +1,104 @@
+"""
+Baked chunk images packed into atlas files, an alternative to a PNG per chunk
+
+Atlas files are app.database.region files holding an ATLAS_SIZE x
+ATLAS_SIZE square of chunk images, each entry:
+
+    header:  image key (20s, the sha1 digest), codec (B), width (H),
+             height (H)
+    payload: RGB pixels bottom row first, as pyglet takes them, stored as
+             they are (RAW) or zlib compressed (ZLIB)
+
+Reading a chunk is a slice of the file's memory map. Images are only
+compressed in the bake workers and the image writer's thread, but
+decompressed on the game loop when a chunk loads, so RAW is the default
+and ZLIB, several times smaller on disk, costs milliseconds per load.
+"""
+import struct
+import zlib
+
+import config
+from app.database.region import RegionFile, RegionFiles
+from app.system.exceptions import RegionFormatError
+
+
+MAGIC = b'ATL1'
+ATLAS_SIZE = 8
+SECTOR = 4096
+ENTRY_HEADER = struct.Struct('<20sBHH')
+RAW = 0
+ZLIB = 1
+CODECS = {'raw': RAW, 'zlib': ZLIB}
+ZLIB_LEVEL = 6
+
+
+def pack_image(key, pixels, width, height, codec=None):
+    codec = CODECS[codec or config.atlas_compression]
+    payload = zlib.compress(pixels, ZLIB_LEVEL) if codec == ZLIB else pixels
+    return ENTRY_HEADER.pack(bytes.fromhex(key), codec, width, height) + payload
+
+
+def unpack_image(blob):
+    """
+    (key, width, height, pixels) of an atlas entry
+    """
+    digest, codec, width, height = ENTRY_HEADER.unpack_from(blob)
+    payload = blob[ENTRY_HEADER.size:]
+    if codec == ZLIB:
+        pixels = zlib.decompress(payload)
+    elif codec == RAW:
+        pixels = bytes(payload)
+    else:
+        raise RegionFormatError(f'Unknown atlas codec {codec}')
+    if len(pixels) != width*height*3:
+        raise RegionFormatError(f'Atlas entry has {len(pixels)} bytes for a {width}x{height} image')
+    return digest.hex(), width, height, pixels
+
+
+def entry_key(blob):
+    return ENTRY_HEADER.unpack_from(blob)[0].hex()
+
+
+class AtlasFile(RegionFile):
+    magic = MAGIC
+    sector = SECTOR
+    region_size = ATLAS_SIZE
+
+
+class Atlas(RegionFiles):
+    """
+    Chunk images in a directory of atlas files named {r_x}_{r_y}.atlas,
+    each chunk's slot holding the image for one key at a time
+    """
+    file_class = AtlasFile
+    extension = '.atlas'
+
+    def load(self, x, y, key):
+        """
+        Pixels of chunk (x, y)'s image with key, or None
+        """
+        blob = self.read(x, y)
+        if blob is None or entry_key(blob) != key:
+            return None
+        return unpack_image(blob)[3]
+
+    def has(self, x, y, key):
+        header = self.read(x, y, ENTRY_HEADER.size)
+        return header is not None and entry_key(header) == key
+
+    def save(self, x, y, blob):
+        self.write(x, y, blob)
+
+    def collect_garbage(self, keys):
+        """
+        Drop every image that isn't keys[coord] for its chunk and compact
+        the files, returning the number of images dropped
+        """
+        removed = 0
+        for coord in self.coords():
+            header = self.read(*coord, ENTRY_HEADER.size)
+            if keys.get(coord) != entry_key(header):
+                self.delete(*coord)
+                removed += 1
+        self.compact()
+        return removed
@@ -0,0 +1,124 @@
+"""
+The thread behind the write-behind queues, Persister and ImageWriter
+"""
+import atexit
+import threading
+
+
+class BackgroundWriter:
+    """
+    Runs queued work on a daemon thread, started by the first start() and
+    stopped by stop() or at exit once the queue has drained. Subclasses keep
+    their queue under self.condition and fill in has_work, take, process,
+    done and idle. The thread wakes as soon as there is work, or with
+    `interval` set, every `interval` seconds and on flush(). If the thread
+    dies, flush() raises what killed it instead of waiting forever.
+    """
+    name = 'background writer'
+    interval = None
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopping = False
+        self.flushing = False
+        self.error = None
+
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stopping = False
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+        # Scripts that never call stop() still get their writes done
+        atexit.register(self.stop)
+
+
+    def has_work(self):
+        raise NotImplementedError
+
+
+    def take(self):
+        """
+        Called holding the condition, remove and return the next work
+        """
+        raise NotImplementedError
+
+
+    def process(self, work):
+        raise NotImplementedError
+
+
+    def done(self, work):
+        """
+        Called holding the condition once work has been processed
+        """
+
+
+    def idle(self):
+        """
+        Called holding the condition, whether everything queued is done
+        """
+        return not self.has_work()
+
+
+    def wake(self):
+        if self.interval is None:
+            return self.stopping or self.flushing or self.has_work()
+        return self.stopping or self.flushing
+
+
+    def run(self):
+        try:
+            self.loop()
+        except BaseException as error:
+            with self.condition:
+                self.error = error
+                self.condition.notify_all()
+            raise
+
+
+    def loop(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(self.wake, self.interval)
+                self.flushing = False
+                if not self.has_work():
+                    if self.stopping:
+                        return
+                    continue
+                work = self.take()
+            self.process(work)
+            with self.condition:
+                self.done(work)
+                self.condition.notify_all()
+
+
+    def flush(self, timeout=None):
+        """
+        Block until everything queued so far is done, raising whatever
+        killed the thread if it died
+        """
+        if self.thread is None:
+            return True
+        with self.condition:
+            self.flushing = True
+            self.condition.notify_all()
+            done = self.condition.wait_for(lambda: self.idle() or self.error is not None,
+                                           timeout)
+            if self.error is not None:
+                raise self.error
+            return done
+
+
+    def stop(self, timeout=None):
+        if self.thread is None:
+            return
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+        self.thread = None
+        atexit.unregister(self.stop)
@@ -0,0 +1,77 @@
+"""
+Chunk image baking in worker processes
+"""
+import traceback
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from app.system.chunk_images import encode_image, image_key
+from app.system.utils import Coord
+
+
+# key is the app.system.chunk_images key of the terrain baked; box is the
+# (left, top, right, bottom) pixel box baked in the chunk image, and base
+# the key of the image it patches, both None for the whole image; pixels
+# are the box's RGB bytes bottom row first, ready for pyglet, and img the
+# whole image encoded by encode_image, None for a box
+BakedImage = namedtuple('BakedImage', ('x', 'y', 'key', 'box', 'base', 'pixels', 'img'))
+
+
+def bake_chunk(x, y, z_grid, foliage_grid, edges, box=None, base=None):
+    from app.entities.chunk import Chunk
+    chunk = Chunk(x, y)
+    chunk.set_terrain(z_grid, foliage_grid)
+    key = image_key(x, y, chunk.z_grid, chunk.foliage_grid, edges)
+    pixels = chunk.render_pixels(box, edges)
+    img = encode_image(key, pixels) if box is None else None
+    return BakedImage(x, y, key, box, base, pixels, img)
+
+
+class ChunkBakingService:
+    """
+    Renders chunk images in a process pool from a snapshot of the chunk's
+    grids and its neighbours' border z values. Bakes of the same chunk are
+    handed back in the order they were submitted, so a later partial
+    re-render is never overwritten by an earlier bake. A bake that fails
+    is reported and dropped, leaving the chunk's key without an image, so
+    it is baked whole the next time it is shown.
+    """
+
+    def __init__(self, max_workers=None):
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.pending = {}
+        self.errors = 0
+
+    def submit(self, chunk, box=None, base=None):
+        """
+        Bake the chunk's image, or just box of it over the image with key
+        base
+        """
+        future = self.executor.submit(bake_chunk, chunk.x, chunk.y,
+                                      chunk.z_grid.copy(), chunk.foliage_grid.copy(),
+                                      chunk.lower_neighbour_z(), box, base)
+        self.pending.setdefault(chunk.coord, deque()).append(future)
+        return future
+
+    def is_pending(self, x, y):
+        return Coord(x, y) in self.pending
+
+    def completed(self):
+        baked = []
+        for coord in list(self.pending):
+            futures = self.pending[coord]
+            while futures and futures[0].done():
+                future = futures.popleft()
+                error = future.exception()
+                if error is not None:
+                    self.errors += 1
+                    traceback.print_exception(type(error), error, error.__traceback__)
+                else:
+                    baked.append(future.result())
+            if not futures:
+                del self.pending[coord]
+        return baked
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+        self.pending.clear()
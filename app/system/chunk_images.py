@@ -0,0 +1,305 @@
+"""
+Baked chunk images, named by a hash of everything that goes into them
+
+A chunk's image is baked again whenever its terrain, the z values its
+borders are shaded against, the thresholds and sizes the renderer uses,
+the map seed or a decal asset change, as any of those gives it a new key.
+The chunk's coordinate is part of the key too, as it seeds the decals.
+Images are kept as a PNG per key or packed into atlas files, depending on
+config.chunk_img_format, and images no stored chunk has the key of are
+left behind until collect_garbage removes them.
+"""
+import hashlib
+import io
+import os
+import traceback
+from collections import deque, namedtuple
+
+import numpy as np
+from PIL import Image
+
+import config
+from app.entities.block import NOOB_WALL
+from app.system import terrain
+from app.system.atlas import Atlas, pack_image
+from app.system.background import BackgroundWriter
+from app.system.decals import decals
+from app.system.utils import Coord
+
+
+# Bump when a change to the renderer changes the images it makes
+RENDER_VERSION = 1
+
+
+def render_key():
+    """
+    Identifies the images the renderer produces for a given terrain
+    """
+    params = (RENDER_VERSION, config.map_seed, config.sea_level, config.sand_level,
+              config.grass_level, config.snow_level, NOOB_WALL, config.window_width,
+              config.window_height, config.block_width, config.block_height,
+              decals.version())
+    return hashlib.sha1(repr(params).encode()).hexdigest()[:16]
+
+
+def lower_edges(x, y, w_z_grid=None, s_z_grid=None):
+    """
+    (west, south) z values chunk (x, y)'s border outlines are shaded
+    against, from the z grids of the chunks west and south of it. Where a
+    neighbour isn't stored they come from the terrain it will be generated
+    with, so an image only ever depends on what is stored.
+    """
+    if w_z_grid is None or s_z_grid is None:
+        gen_w_z, gen_s_z = terrain.gen_lower_edges(x, y)
+    w_z = np.array(w_z_grid[:, -1], dtype=np.int8) if w_z_grid is not None else gen_w_z
+    s_z = np.array(s_z_grid[-1, :], dtype=np.int8) if s_z_grid is not None else gen_s_z
+    return w_z, s_z
+
+
+def image_key(x, y, z_grid, foliage_grid, edges):
+    """
+    Key of chunk (x, y)'s image, edges being its lower_edges
+    """
+    digest = hashlib.sha1(render_key().encode())
+    digest.update(repr((x, y)).encode())
+    for grid in (z_grid, foliage_grid, *edges):
+        digest.update(np.ascontiguousarray(grid, dtype=np.int8).tobytes())
+    return digest.hexdigest()
+
+
+def image_path(key, root=config.chunk_img_dir):
+    return os.path.join(root, f'{key}.png')
+
+
+def write_image(key, write, root=config.chunk_img_dir):
+    # Write next to the target and swap it in, so an interrupted write
+    # never leaves a truncated image behind to be mistaken for a bake
+    img_file = image_path(key, root)
+    os.makedirs(os.path.dirname(img_file), exist_ok=True)
+    tmp_file = img_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        write(f)
+    os.replace(tmp_file, img_file)
+
+
+def paste_pixels(base, box, pixels, width=config.window_width, height=config.window_height):
+    """
+    The image base with pixels pasted over its (left, top, right, bottom)
+    box, all RGB bytes bottom row first
+    """
+    left, top, right, bottom = box
+    img = np.frombuffer(base, dtype=np.uint8).reshape(height, width, 3).copy()
+    # Rows run bottom up
+    img[height-bottom:height-top, left:right] = \
+        np.frombuffer(pixels, dtype=np.uint8).reshape(bottom-top, right-left, 3)
+    return img.tobytes()
+
+
+def live_keys(store):
+    """
+    {coord: image key} of every chunk in the store
+    """
+    stored = {coord: store.load(*coord) for coord in store.coords()}
+    keys = {}
+    for (x, y), fields in stored.items():
+        if fields is None:
+            continue
+        w_fields, s_fields = stored.get((x-1, y)), stored.get((x, y-1))
+        edges = lower_edges(x, y, w_fields[0] if w_fields is not None else None,
+                            s_fields[0] if s_fields is not None else None)
+        keys[Coord(x, y)] = image_key(x, y, *fields, edges)
+    return keys
+
+
+class PngImages:
+    """
+    One PNG per image under root, named by its key
+    """
+
+    def __init__(self, root=config.chunk_img_dir):
+        self.root = root
+
+    @staticmethod
+    def encode(key, pixels, width, height):
+        img = Image.frombuffer('RGB', (width, height), pixels, 'raw', 'RGB', 0, -1)
+        img_buffer = io.BytesIO()
+        img.save(img_buffer, format='PNG')
+        return img_buffer.getvalue()
+
+    def load(self, x, y, key):
+        img_file = image_path(key, self.root)
+        if not os.path.isfile(img_file):
+            return None
+        with Image.open(img_file) as img:
+            return np.asarray(img.convert('RGB'))[::-1].tobytes()
+
+    def has(self, x, y, key):
+        return os.path.isfile(image_path(key, self.root))
+
+    def save(self, x, y, key, blob):
+        write_image(key, lambda f: f.write(blob), self.root)
+
+    def collect_garbage(self, keys):
+        """
+        Remove every file under root that isn't the image of one of keys,
+        {coord: key}, including images named the old way and interrupted
+        writes. Returns the number of files removed.
+        """
+        if not os.path.isdir(self.root):
+            return 0
+        keep = {os.path.basename(image_path(key, self.root)) for key in keys.values()}
+        removed = 0
+        for entry in os.listdir(self.root):
+            if entry not in keep:
+                os.remove(os.path.join(self.root, entry))
+                removed += 1
+        return removed
+
+    def close(self):
+        pass
+
+
+class AtlasImages(Atlas):
+    """
+    Images packed into app.system.atlas files under root
+    """
+
+    def __init__(self, root=config.atlas_dir):
+        super().__init__(root)
+
+    @staticmethod
+    def encode(key, pixels, width, height):
+        return pack_image(key, pixels, width, height)
+
+    def save(self, x, y, key, blob):
+        super().save(x, y, blob)
+
+
+IMAGE_FORMATS = {
+    'png': PngImages,
+    'atlas': AtlasImages,
+}
+
+
+# A patch waiting in the ImageWriter: pixels over box of chunk (x, y)'s
+# image with key base
+Patch = namedtuple('Patch', ('x', 'y', 'base', 'box', 'pixels'))
+
+
+def make_images(image_format=config.chunk_img_format):
+    return IMAGE_FORMATS[image_format]()
+
+
+def encode_image(key, pixels, width=config.window_width, height=config.window_height):
+    """
+    pixels, RGB bottom row first, encoded for config.chunk_img_format
+    """
+    return IMAGE_FORMATS[config.chunk_img_format].encode(key, pixels, width, height)
+
+
+class ImageWriter(BackgroundWriter):
+    """
+    Saves chunk images to images, a PngImages or AtlasImages, on its own
+    thread in the order they were queued, so the game loop never waits on
+    an encode or the file system. Until an image is saved its pixels can
+    still be had from pixels(), bottom row first as pyglet takes them.
+    """
+
+    name = 'image writer'
+
+    def __init__(self, images):
+        super().__init__()
+        self.images = images
+        self.queue = deque()
+        self.pending = {}
+        self.writing = None
+        self.written = 0
+        self.errors = 0
+
+
+    def write(self, x, y, key, img, pixels=None):
+        """
+        Queue img, encoded by encode_image, as chunk (x, y)'s image with key
+        """
+        self.put(key, pixels, lambda: self.images.save(x, y, key, img))
+
+
+    def patch(self, x, y, key, base, box, pixels):
+        """
+        Queue pixels of box pasted over chunk (x, y)'s image with key base
+        as its image with key
+        """
+        self.put(key, Patch(x, y, base, box, pixels),
+                 lambda: self.write_patch(x, y, key, base, box, pixels))
+
+
+    def put(self, key, pixels, write):
+        self.start()
+        with self.condition:
+            self.queue.append((key, write))
+            self.pending[key] = pixels
+            self.condition.notify_all()
+
+
+    def write_patch(self, x, y, key, base, box, pixels):
+        base_pixels = self.images.load(x, y, base)
+        if base_pixels is None:
+            # Nothing to patch, the whole image is baked when next shown
+            return
+        self.images.save(x, y, key, encode_image(key, paste_pixels(base_pixels, box, pixels)))
+
+
+    def pixels(self, key):
+        """
+        Pixels of the image queued with key, or None if it isn't queued or
+        was queued without them. A patch is pasted over its base, from the
+        queue or from images.
+        """
+        with self.condition:
+            pixels = self.pending.get(key)
+        if not isinstance(pixels, Patch):
+            return pixels
+        patch = pixels
+        base = self.pixels(patch.base)
+        if base is None:
+            base = self.images.load(patch.x, patch.y, patch.base)
+        if base is None:
+            return None
+        return paste_pixels(base, patch.box, patch.pixels)
+
+
+    def is_pending(self, key):
+        with self.condition:
+            return key in self.pending
+
+
+    def has_work(self):
+        return bool(self.queue)
+
+
+    def take(self):
+        key, write = self.queue.popleft()
+        self.writing = key
+        return key, write
+
+
+    def process(self, work):
+        key, write = work
+        try:
+            write()
+            self.written += 1
+        except Exception:
+            self.errors += 1
+            traceback.print_exc()
+
+
+    def done(self, work):
+        key, _ = work
+        self.writing = None
+        # Unless a later write of the same key is still queued
+        if all(queued != key for queued, _ in self.queue):
+            self.pending.pop(key, None)
+
+
+    def idle(self):
+        return not self.queue and self.writing is None
@@ -0,0 +1,81 @@
+"""
+Decoration images pasted over chunk backgrounds, loaded once per process
+"""
+import hashlib
+import os
+import random
+
+from PIL import Image
+
+import config
+
+
+DECAL_DIR = 'app/assets'
+KINDS = ('rocks', 'snow', 'foliage', 'underwater')
+
+
+class DecalCache:
+    """
+    Each kind is a directory of RGBA images under root, decoded the first
+    time it is asked for and kept as an RGB image plus its alpha mask, ready
+    for Image.paste onto an RGB chunk image.
+    """
+
+    def __init__(self, root=DECAL_DIR):
+        self.root = root
+        self.decals = {}
+        self._version = None
+
+    def get(self, kind):
+        decals = self.decals.get(kind)
+        if decals is None:
+            decals = self.decals[kind] = self.load(kind)
+        return decals
+
+    def load(self, kind):
+        path = os.path.join(self.root, kind)
+        decals = []
+        # Sorted so a seeded choice picks the same file on every system
+        for file_name in sorted(os.listdir(path)):
+            with Image.open(os.path.join(path, file_name)) as image:
+                image = image.convert('RGBA')
+            decals.append((image.convert('RGB'), image.getchannel('A')))
+        return decals
+
+    def version(self):
+        """
+        Hash of every decal file, so anything baked with them can tell
+        when one changes
+        """
+        if self._version is None:
+            digest = hashlib.sha1()
+            for kind in KINDS:
+                path = os.path.join(self.root, kind)
+                for file_name in sorted(os.listdir(path)):
+                    digest.update(f'{kind}/{file_name}'.encode())
+                    with open(os.path.join(path, file_name), 'rb') as f:
+                        digest.update(f.read())
+            self._version = digest.hexdigest()[:16]
+        return self._version
+
+    def extent(self):
+        """
+        (width, height) of the largest decal of any kind
+        """
+        sizes = [image.size for kind in KINDS for image, mask in self.get(kind)]
+        return max(w for w, h in sizes), max(h for w, h in sizes)
+
+    def paste(self, img, kind, position, rng=random):
+        image, mask = rng.choice(self.get(kind))
+        img.paste(image, position, mask)
+
+
+def block_rng(x, y, row, col):
+    """
+    Random numbers for decorating one block of chunk (x, y), the same on
+    every bake and independent of the blocks around it
+    """
+    return random.Random(f'{config.map_seed}:{x}:{y}:{row}:{col}')
+
+
+decals = DecalCache()
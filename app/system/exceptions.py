@@ -2,4 +2,10 @@ class DirectionMismatch(Exception):
     pass
 
 class NoDatabaseModel(Exception):
+    pass
+
+class TerrainFormatError(Exception):
+    pass
+
+class RegionFormatError(Exception):
     pass
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""
+Chunk generation in worker processes
+"""
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from app.system import terrain
+from app.system.chunk_images import encode_image, image_key, lower_edges
+from app.system.tile_cache import worker_cache
+from app.system.utils import Coord
+
+
+# z and foliage are (n_rows, n_cols) int8 grids, img is the image encoded
+# by app.system.chunk_images.encode_image and key its image key, shaded
+# against the neighbours' generated terrain
+GeneratedChunk = namedtuple('GeneratedChunk', ('x', 'y', 'z', 'foliage', 'key', 'img'))
+
+
+def generate_chunk(x, y, z_map=None, foliage_map=None, tile_root=None):
+    from app.entities.chunk import Chunk
+    if z_map is None or foliage_map is None:
+        # Workers only read the tile cache under tile_root, if any; the main
+        # process fills it in Chunk.from_generated
+        fields = worker_cache(tile_root).get(x, y)
+        if fields is None:
+            fields = terrain.bound_fields(*terrain.gen_chunk_fields(x, y))
+        z_map, foliage_map = fields
+    chunk = Chunk(x, y)
+    chunk.build_blocks(z_map, foliage_map)
+    # Workers can't see the store, Chunk.attach_generated drops the image
+    # if a neighbour was stored with other terrain
+    edges = lower_edges(x, y)
+    key = image_key(x, y, chunk.z_grid, chunk.foliage_grid, edges)
+    img = encode_image(key, chunk.render_pixels(edges=edges))
+    return GeneratedChunk(x, y, chunk.z_grid, chunk.foliage_grid, key, img)
+
+
+class ChunkGenerationService:
+    """
+    Runs terrain generation, block construction and image baking for chunks
+    in a process pool. Results are collected on the main thread, which only
+    has to attach and persist them. A job that fails is reported and
+    dropped, and its chunk is generated in process when it is loaded.
+    """
+
+    def __init__(self, max_workers=None, tile_root=None):
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.tile_root = tile_root
+        self.pending = {}
+        self.errors = 0
+
+    def submit(self, x, y, z_map=None, foliage_map=None):
+        coord = Coord(x, y)
+        if coord not in self.pending:
+            self.pending[coord] = self.executor.submit(generate_chunk, x, y, z_map,
+                                                       foliage_map, self.tile_root)
+        return self.pending[coord]
+
+    def is_pending(self, x, y):
+        return Coord(x, y) in self.pending
+
+    def collect(self, coord, future, timeout=None):
+        error = future.exception(timeout)
+        self.pending.pop(coord, None)
+        if error is not None:
+            self.errors += 1
+            traceback.print_exception(type(error), error, error.__traceback__)
+            return None
+        return future.result()
+
+    def result(self, x, y, timeout=None):
+        """
+        The chunk generated at (x, y), or None if its job failed
+        """
+        return self.collect(Coord(x, y), self.submit(x, y), timeout)
+
+    def as_completed(self):
+        coords = {future: coord for coord, future in self.pending.items()}
+        for future in as_completed(coords):
+            generated = self.collect(coords[future], future)
+            if generated is not None:
+                yield generated
+
+    def completed(self):
+        done = [(coord, future) for coord, future in self.pending.items() if future.done()]
+        generated = [self.collect(coord, future) for coord, future in done]
+        return [chunk for chunk in generated if chunk is not None]
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+        self.pending.clear()
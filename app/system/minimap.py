@@ -0,0 +1,66 @@
+"""
+Minimap overlay drawn from the world overview
+"""
+import pyglet
+from pyglet.image import ImageData
+from pyglet.sprite import Sprite
+
+import config
+from app.system.overview import N_COLS, N_ROWS
+
+
+class Minimap:
+    """
+    The part of overview around the player at overview level level, drawn
+    in the window's top right corner. The texture is only redrawn when the
+    overview changes or the player crosses into another chunk, other frames
+    just draw it.
+    """
+
+    def __init__(self, overview, level=config.minimap_level,
+                 width=config.minimap_width, height=config.minimap_height):
+        self.overview = overview
+        self.level = level
+        self.width = width
+        self.height = height
+        self.sprite = None
+        self.marker = None
+        self.drawn = None
+
+    def view(self, chunk):
+        """
+        (u, v) of the overview pixel at the bottom left of the map around chunk
+        """
+        scale = 2**self.level
+        u = ((2*chunk.x + 1)*N_COLS//2)//scale - self.width//2
+        v = ((2*chunk.y + 1)*N_ROWS//2)//scale - self.height//2
+        return u, v
+
+    def pixels(self, chunk):
+        u, v = self.view(chunk)
+        return self.overview.read(self.level, u, v, u + self.width, v + self.height).tobytes()
+
+    def refresh(self, chunk):
+        state = (self.overview.version, chunk.x, chunk.y)
+        if state == self.drawn:
+            return
+        img = ImageData(self.width, self.height, 'RGBA', self.pixels(chunk))
+        if self.sprite is None:
+            x = config.window_width - self.width - config.minimap_margin
+            y = config.window_height - self.height - config.minimap_margin
+            self.sprite = Sprite(img, x=x, y=y)
+            self.sprite.opacity = config.minimap_opacity
+        else:
+            self.sprite.image = img
+        self.drawn = state
+
+    def draw(self, player):
+        self.refresh(player.chunk)
+        self.sprite.draw()
+        if self.marker is None:
+            self.marker = pyglet.shapes.Rectangle(0, 0, 3, 3, color=(200, 0, 0))
+        # The player's position within the chunk, as the view is centred on it
+        scale = 2**self.level
+        self.marker.x = self.sprite.x + self.width//2 + (player.x - config.window_width/2)/config.block_width/scale
+        self.marker.y = self.sprite.y + self.height//2 + (player.y - config.window_height/2)/config.block_height/scale
+        self.marker.draw()
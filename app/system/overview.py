@@ -0,0 +1,124 @@
+"""
+World overview built from chunk z grids, at several scales at once
+"""
+import numpy as np
+
+import config
+from app.entities.block import block_colors
+from app.system.utils import distance
+
+
+TILE = 256
+LEVELS = 6
+N_ROWS = config.window_height//config.block_height
+N_COLS = config.window_width//config.block_width
+
+
+def downsample(pixels):
+    """
+    Average each 2x2 square of an RGBA array, weighting colors by alpha so
+    ungenerated chunks don't darken their neighbours
+    """
+    h, w = pixels.shape[0]//2, pixels.shape[1]//2
+    squares = pixels.reshape(h, 2, w, 2, 4).astype(np.uint32)
+    alpha = squares[..., 3].sum(axis=(1, 3))
+    rgb = (squares[..., :3]*squares[..., 3:]).sum(axis=(1, 3))//np.maximum(alpha, 1)[..., None]
+    return np.dstack([rgb, alpha//4]).astype(np.uint8)
+
+
+class Overview:
+    """
+    The world at one pixel per block at level 0, each level above half the
+    size of the one below, kept as TILE x TILE RGBA tiles. Pixel (u, v) of
+    level 0 is block (v % N_ROWS, u % N_COLS) of chunk (u // N_COLS,
+    v // N_ROWS), so rows run bottom up as in pyglet. Alpha is 0 where no
+    chunk has been added.
+
+    Stored chunks are queued and drawn in a few at a time by fill, so the
+    map comes together around the player instead of stalling startup.
+    """
+
+    def __init__(self, levels=LEVELS):
+        self.levels = levels
+        self.tiles = {}
+        # Bumped on every change, so views can tell when to redraw
+        self.version = 0
+        # Stored chunks still to draw, farthest first to pop the nearest
+        self.pending = []
+        self.queued = set()
+
+    def tile(self, level, t_u, t_v, create=False):
+        tile = self.tiles.get((level, t_u, t_v))
+        if tile is None and create:
+            tile = self.tiles[(level, t_u, t_v)] = np.zeros((TILE, TILE, 4), dtype=np.uint8)
+        return tile
+
+    def tile_spans(self, u0, v0, u1, v1):
+        # (t_u, t_v, slices into the tile, slices into the u0..u1 x v0..v1 box)
+        for t_v in range(v0//TILE, -(-v1//TILE)):
+            for t_u in range(u0//TILE, -(-u1//TILE)):
+                tu0, tv0 = max(u0, t_u*TILE), max(v0, t_v*TILE)
+                tu1, tv1 = min(u1, (t_u+1)*TILE), min(v1, (t_v+1)*TILE)
+                yield (t_u, t_v,
+                       np.s_[tv0-t_v*TILE:tv1-t_v*TILE, tu0-t_u*TILE:tu1-t_u*TILE],
+                       np.s_[tv0-v0:tv1-v0, tu0-u0:tu1-u0])
+
+    def read(self, level, u0, v0, u1, v1):
+        """
+        (v1-v0, u1-u0, 4) array of level's pixels u0..u1, v0..v1
+        """
+        pixels = np.zeros((v1-v0, u1-u0, 4), dtype=np.uint8)
+        for t_u, t_v, in_tile, in_box in self.tile_spans(u0, v0, u1, v1):
+            tile = self.tile(level, t_u, t_v)
+            if tile is not None:
+                pixels[in_box] = tile[in_tile]
+        return pixels
+
+    def write(self, level, u0, v0, pixels):
+        v1, u1 = v0 + pixels.shape[0], u0 + pixels.shape[1]
+        for t_u, t_v, in_tile, in_box in self.tile_spans(u0, v0, u1, v1):
+            self.tile(level, t_u, t_v, create=True)[in_tile] = pixels[in_box]
+
+    def add(self, x, y, z_grid):
+        """
+        Draw chunk (x, y) into level 0 and redo just the pixels above it
+        """
+        colors = np.clip(block_colors(z_grid), 0, 255).astype(np.uint8)
+        pixels = np.dstack([colors, np.full(colors.shape[:2], 255, dtype=np.uint8)])
+        self.queued.discard((x, y))
+        u0, v0 = x*N_COLS, y*N_ROWS
+        u1, v1 = u0 + N_COLS, v0 + N_ROWS
+        self.write(0, u0, v0, pixels)
+        for level in range(1, self.levels):
+            u0, v0, u1, v1 = u0//2, v0//2, -(-u1//2), -(-v1//2)
+            children = self.read(level-1, 2*u0, 2*v0, 2*u1, 2*v1)
+            self.write(level, u0, v0, downsample(children))
+        self.version += 1
+
+    def queue(self, coords, x=0, y=0):
+        """
+        Queue chunks to be drawn from the store by fill, nearest (x, y) first
+        """
+        self.queued.update((c_x, c_y) for c_x, c_y in coords)
+        self.pending = sorted(self.queued, key=lambda coord: distance(x, y, *coord), reverse=True)
+
+    def fill(self, store, n):
+        """
+        Draw up to n of the queued chunks, skipping any added since they
+        were queued, and return how many were drawn
+        """
+        drawn = 0
+        while self.pending and drawn < n:
+            coord = self.pending.pop()
+            if coord not in self.queued:
+                continue
+            self.queued.discard(coord)
+            fields = store.load(*coord)
+            if fields is not None:
+                self.add(*coord, fields[0])
+                drawn += 1
+        return drawn
+
+    def build(self, store):
+        self.queue(store.coords())
+        self.fill(store, len(self.pending))
@@ -0,0 +1,84 @@
+"""
+Uniform grid broadphase for collisions between a chunk's entities
+"""
+import config
+
+
+class SpatialHash:
+    """
+    Entities bucketed by the cell_size x cell_size cells their rects cover,
+    so an entity is only tested against the others in the same cells.
+    Entities are moved between buckets with move() as they move.
+    """
+
+    def __init__(self, cell_size=config.collision_cell):
+        self.cell_size = cell_size
+        # {cell: {entity: None}}, dicts as ordered sets
+        self.cells = {}
+        # {entity: (cx0, cy0, cx1, cy1)} cells each entity is in, inclusive
+        self.spans = {}
+
+    def span(self, entity):
+        size = self.cell_size
+        return (int(entity.x//size), int(entity.y//size),
+                int((entity.x + entity.width)//size), int((entity.y + entity.height)//size))
+
+    def add_span(self, entity, span):
+        cx0, cy0, cx1, cy1 = span
+        for cx in range(cx0, cx1+1):
+            for cy in range(cy0, cy1+1):
+                self.cells.setdefault((cx, cy), {})[entity] = None
+        self.spans[entity] = span
+
+    def remove_span(self, entity, span):
+        cx0, cy0, cx1, cy1 = span
+        for cx in range(cx0, cx1+1):
+            for cy in range(cy0, cy1+1):
+                bucket = self.cells[(cx, cy)]
+                del bucket[entity]
+                if not bucket:
+                    del self.cells[(cx, cy)]
+
+    def insert(self, entity):
+        if entity not in self.spans:
+            self.add_span(entity, self.span(entity))
+
+    def remove(self, entity):
+        span = self.spans.pop(entity, None)
+        if span is not None:
+            self.remove_span(entity, span)
+
+    def move(self, entity):
+        """
+        Rebucket entity after it moved, a no-op while it stays in its cells
+        """
+        span = self.span(entity)
+        old_span = self.spans.get(entity)
+        if span != old_span:
+            if old_span is not None:
+                self.remove_span(entity, old_span)
+            self.add_span(entity, span)
+
+    def sync(self, entities):
+        """
+        Make the hash hold exactly entities, adding and removing the
+        difference. Entities already in it are left where they were.
+        """
+        entities = dict.fromkeys(entities)
+        for entity in [entity for entity in self.spans if entity not in entities]:
+            self.remove(entity)
+        for entity in entities:
+            self.insert(entity)
+
+    def near(self, entity):
+        """
+        Entities sharing a cell with entity's rect, entity included if hashed
+        """
+        cx0, cy0, cx1, cy1 = self.span(entity)
+        if cx0 == cx1 and cy0 == cy1:
+            return list(self.cells.get((cx0, cy0), ()))
+        found = {}
+        for cx in range(cx0, cx1+1):
+            for cy in range(cy0, cy1+1):
+                found.update(self.cells.get((cx, cy), {}))
+        return list(found)
@@ -0,0 +1,130 @@
+"""
+Terrain field generation for single chunks and rectangular regions of chunks
+"""
+import hashlib
+
+import numpy as np
+
+import config
+from app.system.perlin import pnoise2
+
+
+Z_SCALE = 5000
+FOLIAGE_SCALE = 10000
+OCTAVES = 6
+PERSISTENCE = 0.4
+LACUNARITY = 2.0
+AMPLITUDE = 300
+
+N_ROWS = config.window_height//config.block_height
+N_COLS = config.window_width//config.block_width
+
+# Bump when the generator changes in a way its parameters don't capture
+GENERATOR_VERSION = 1
+
+
+def generator_key():
+    """
+    Identifies the fields this module produces; anything cached against
+    terrain must be keyed on it.
+    """
+    params = (GENERATOR_VERSION, config.map_seed, Z_SCALE, FOLIAGE_SCALE, OCTAVES,
+              PERSISTENCE, LACUNARITY, AMPLITUDE, config.window_width,
+              config.window_height, config.block_width, config.block_height,
+              config.env_param_low_bound, config.env_param_high_bound)
+    return hashlib.sha1(repr(params).encode()).hexdigest()[:16]
+
+
+def block_axis(chunk_i, chunk_size, block_size):
+    return np.linspace(chunk_i*chunk_size,
+                       chunk_i*chunk_size + chunk_size - block_size,
+                       chunk_size//block_size).astype(int)
+
+
+def x_axis(x0, x1):
+    return np.concatenate([block_axis(x, config.window_width, config.block_width)
+                           for x in range(x0, x1+1)])
+
+
+def y_axis(y0, y1):
+    return np.concatenate([block_axis(y, config.window_height, config.block_height)
+                           for y in range(y0, y1+1)])
+
+
+def gen_fields(x_i, y_i, scales=(Z_SCALE, FOLIAGE_SCALE)):
+    """
+    Noise fields for the block coordinates x_i (columns) and y_i (rows), one
+    per scale, stacked as (len(scales), len(y_i), len(x_i)) and computed in a
+    single pass.
+    """
+    scales = np.array(scales, dtype=float)[:, None, None]
+    fields = pnoise2(x_i[None, None, :]/scales,
+                     y_i[None, :, None]/scales,
+                     octaves=OCTAVES,
+                     persistence=PERSISTENCE,
+                     lacunarity=LACUNARITY,
+                     repeatx=config.window_width,
+                     repeaty=config.window_height,
+                     base=config.map_seed)
+    return fields*AMPLITUDE
+
+
+def gen_chunk_fields(x, y):
+    z_map, foliage_map = gen_fields(x_axis(x, x), y_axis(y, y))
+    return z_map, foliage_map
+
+
+def gen_lower_edges(x, y):
+    """
+    z values of the column west and the row south of chunk (x, y) as those
+    neighbours are generated, bounded like their grids
+    """
+    w_z = gen_fields(x_axis(x-1, x-1)[-1:], y_axis(y, y), scales=(Z_SCALE,))[0][:, 0]
+    s_z = gen_fields(x_axis(x, x), y_axis(y-1, y-1)[-1:], scales=(Z_SCALE,))[0][0, :]
+    return bound_fields(w_z, s_z)
+
+
+def bound_fields(*fields):
+    """
+    Array form of utils.env_bound: the int8 grids blocks are built from
+    """
+    return tuple(np.clip(np.round(field), config.env_param_low_bound,
+                         config.env_param_high_bound).astype(np.int8)
+                 for field in fields)
+
+
+class Region:
+    """
+    z and foliage fields for every chunk in x0..x1, y0..y1 (inclusive),
+    generated as one array and handed out as per-chunk views
+    """
+
+    def __init__(self, x0, y0, x1, y1):
+        self.x0 = x0
+        self.y0 = y0
+        self.x1 = x1
+        self.y1 = y1
+        self.z_map, self.foliage_map = gen_fields(x_axis(x0, x1), y_axis(y0, y1))
+
+    @classmethod
+    def around(cls, x, y, radius):
+        return cls(x-radius, y-radius, x+radius, y+radius)
+
+    @property
+    def coords(self):
+        return [(x, y) for y in range(self.y0, self.y1+1)
+                       for x in range(self.x0, self.x1+1)]
+
+    def __contains__(self, coord):
+        x, y = coord
+        return self.x0 <= x <= self.x1 and self.y0 <= y <= self.y1
+
+    def fields(self, x, y):
+        if (x, y) not in self:
+            raise KeyError(f'Chunk ({x}, {y}) is outside {self}')
+        rows = slice((y-self.y0)*N_ROWS, (y-self.y0+1)*N_ROWS)
+        cols = slice((x-self.x0)*N_COLS, (x-self.x0+1)*N_COLS)
+        return self.z_map[rows, cols], self.foliage_map[rows, cols]
+
+    def __repr__(self):
+        return f'<Region ({self.x0}, {self.y0}) -> ({self.x1}, {self.y1})>'
@@ -0,0 +1,128 @@
+"""
+On-disk cache of per-chunk z and foliage grids, read through np.memmap
+"""
+import os
+import shutil
+
+import numpy as np
+
+import config
+from app.system import terrain
+
+
+REGION_SIZE = 16
+# env_bound keeps fields within -100..100, so this marks an empty slot
+EMPTY = -128
+
+
+class TileCache:
+    """
+    Each file holds a REGION_SIZE x REGION_SIZE square of chunks as a raw
+    int8 array of shape (REGION_SIZE, REGION_SIZE, 2, n_rows, n_cols), so
+    reading a chunk is a slice of a memory map. Files live in a directory
+    named by terrain.generator_key(); directories for any other key are
+    removed on first use.
+    """
+
+    def __init__(self, root=config.tile_cache_dir):
+        self.root = root
+        self.key = None
+        self.regions = {}
+
+    @property
+    def shape(self):
+        return (REGION_SIZE, REGION_SIZE, 2, terrain.N_ROWS, terrain.N_COLS)
+
+    @property
+    def path(self):
+        return os.path.join(self.root, self.key)
+
+    def open(self):
+        key = terrain.generator_key()
+        if key == self.key:
+            return
+        self.regions.clear()
+        self.key = key
+        os.makedirs(self.path, exist_ok=True)
+        for entry in os.listdir(self.root):
+            if entry != key:
+                shutil.rmtree(os.path.join(self.root, entry), ignore_errors=True)
+
+    def region_file(self, r_x, r_y):
+        return os.path.join(self.path, f'{r_x}_{r_y}.tiles')
+
+    def region(self, x, y, create=False):
+        self.open()
+        r_coord = (x//REGION_SIZE, y//REGION_SIZE)
+        tiles = self.regions.get(r_coord)
+        if tiles is not None and (tiles.mode == 'r+' or not create):
+            return tiles
+
+        region_file = self.region_file(*r_coord)
+        if not os.path.isfile(region_file):
+            if not create:
+                return None
+            tmp_file = region_file + '.tmp'
+            empty = np.memmap(tmp_file, dtype=np.int8, mode='w+', shape=self.shape)
+            empty[:] = EMPTY
+            empty.flush()
+            del empty
+            os.replace(tmp_file, region_file)
+
+        tiles = np.memmap(region_file, dtype=np.int8,
+                          mode='r+' if create else 'r', shape=self.shape)
+        self.regions[r_coord] = tiles
+        return tiles
+
+    def get(self, x, y):
+        tiles = self.region(x, y)
+        if tiles is None:
+            return None
+        tile = tiles[y % REGION_SIZE, x % REGION_SIZE]
+        if tile[0, 0, 0] == EMPTY:
+            return None
+        return tile[0], tile[1]
+
+    def put(self, x, y, z_grid, foliage_grid):
+        tiles = self.region(x, y, create=True)
+        tile = tiles[y % REGION_SIZE, x % REGION_SIZE]
+        # z goes in last since its first cell is what marks the tile present.
+        # Not flushed, this runs on the game loop and the OS writes the
+        # pages back on its own
+        tile[1] = foliage_grid
+        tile[0] = z_grid
+
+    def __contains__(self, coord):
+        return self.get(*coord) is not None
+
+
+class NullTileCache:
+    """
+    Caches nothing, for stores that keep nothing on disk
+    """
+    root = None
+
+    def get(self, x, y):
+        return None
+
+    def put(self, x, y, z_grid, foliage_grid):
+        pass
+
+    def __contains__(self, coord):
+        return False
+
+
+def make_tile_cache(store):
+    return TileCache() if store.on_disk else NullTileCache()
+
+
+# Workers' caches by root, so their memory maps stay open between jobs
+worker_caches = {}
+
+
+def worker_cache(root):
+    if root is None:
+        return NullTileCache()
+    if root not in worker_caches:
+        worker_caches[root] = TileCache(root)
+    return worker_caches[root]
@@ -0,0 +1,84 @@
+"""
+Recently unloaded chunks, kept in compact form so walking back into one
+skips the store read and the image load and finds its NPCs where they were
+"""
+import sys
+from collections import OrderedDict, namedtuple
+
+import config
+from app.system.utils import Coord
+
+
+# z and foliage are the chunk's int8 grids; pixels its baked image, RGB
+# bottom row first, or None if it wasn't baked, and key that image's key;
+# npcs an (x, y, hp) tuple per live NPC
+WarmChunk = namedtuple('WarmChunk', ('x', 'y', 'name', 'z', 'foliage', 'key', 'pixels', 'npcs'))
+
+
+def deep_size(obj):
+    # Bytes held by obj and, for tuples, everything in it
+    size = sys.getsizeof(obj)
+    if isinstance(obj, tuple):
+        size += sum(deep_size(item) for item in obj)
+    return size
+
+
+class WarmChunkCache:
+    """
+    Least recently unloaded chunks are dropped first once the WarmChunks
+    held add up to more than `budget` bytes, counting everything they hold.
+    """
+
+    def __init__(self, budget=config.warm_cache_bytes):
+        self.budget = budget
+        self.chunks = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def put(self, warm):
+        coord = Coord(warm.x, warm.y)
+        self.discard(coord)
+        nbytes = deep_size(warm)
+        self.chunks[coord] = (warm, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.budget and self.chunks:
+            self.evict()
+
+    def take(self, coord):
+        """
+        Remove and return the WarmChunk at coord, or None
+        """
+        if coord not in self.chunks:
+            self.misses += 1
+            return None
+        self.hits += 1
+        warm, nbytes = self.chunks.pop(coord)
+        self.nbytes -= nbytes
+        return warm
+
+    def discard(self, coord):
+        if coord in self.chunks:
+            self.nbytes -= self.chunks.pop(coord)[1]
+
+    def evict(self):
+        coord, (warm, nbytes) = self.chunks.popitem(last=False)
+        self.nbytes -= nbytes
+        self.evictions += 1
+
+    def __contains__(self, coord):
+        return coord in self.chunks
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'chunks': len(self.chunks),
+                'nbytes': self.nbytes,
+                'budget': self.budget,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits/lookups if lookups else 0.0}
@@ -1,6 +1,7 @@
 from pyglet.window import key, Window as PyWindow
 
 import config
+from app.system.minimap import Minimap
 from app.system.utils import Coord
 
 
@@ -16,11 +17,13 @@ class Window(PyWindow):
         self.world = world
         self.player = player
         self.push_handlers(player.key_handler)
-        
+        self.minimap = Minimap(world.overview)
+
     def draw(self):
         self.clear()
         if self.player:
             self.player.chunk.draw_batch.draw()
+            self.minimap.draw(self.player)
 
 
     def update(self):
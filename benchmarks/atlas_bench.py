@@ -0,0 +1,77 @@
+"""
+Chunk image save and load cost as a PNG per chunk vs packed into atlases
+
+Run from the repository root:
+    python -m benchmarks.atlas_bench [n_chunks]
+
+Each format works in a temporary directory, config.chunk_img_dir and
+config.atlas_dir are not touched. Load is from bytes on disk to pixels
+ready for pyglet.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from functools import partial
+
+import pyglet
+pyglet.options['shadow_window'] = False
+
+from app import world
+from app.database import MemoryChunkStore
+from app.entities.chunk import Chunk
+from app.system import atlas
+from app.system.chunk_images import AtlasImages, PngImages
+
+
+def formats(tmp):
+    # (name, images, encode) with encode taking (key, pixels, width, height)
+    yield 'png', PngImages(os.path.join(tmp, 'png')), PngImages.encode
+    for codec in atlas.CODECS:
+        yield (f'atlas {codec}', AtlasImages(os.path.join(tmp, codec)),
+               partial(atlas.pack_image, codec=codec))
+
+
+def disk_usage(root):
+    files = [os.path.join(root, entry) for entry in os.listdir(root)]
+    return len(files), sum(os.path.getsize(f) for f in files)
+
+
+def main(n_chunks=64):
+    # Image keys read the neighbours' terrain from the store
+    world.store = MemoryChunkStore()
+    side = int(n_chunks**0.5)
+    chunks = []
+    for x in range(side):
+        for y in range(side):
+            chunk = Chunk(x, y)
+            chunk.build_blocks()
+            chunks.append(chunk)
+    # Rendering dominates and is the same for every format, so only the
+    # first chunk is rendered and its pixels reused under each chunk's key
+    pixels = chunks[0].render_pixels(edges=(None, None))
+    print(f'{len(chunks)} chunks')
+
+    lookups = [random.choice(chunks) for _ in range(100)]
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, images, encode in formats(tmp):
+            start = time.perf_counter()
+            for chunk in chunks:
+                img = encode(chunk.img_key, pixels, chunk.width, chunk.height)
+                images.save(chunk.x, chunk.y, chunk.img_key, img)
+            save_t = (time.perf_counter() - start)/len(chunks)
+
+            start = time.perf_counter()
+            for chunk in lookups:
+                assert images.load(chunk.x, chunk.y, chunk.img_key) == pixels
+            load_t = (time.perf_counter() - start)/len(lookups)
+            images.close()
+
+            n_files, size = disk_usage(images.root)
+            print(f'{name:12s} save {save_t*1000:7.2f}ms/chunk  load {load_t*1000:6.2f}ms/chunk  '
+                  f'{n_files} files, {size/len(chunks)/1024:.0f}KiB/chunk')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,94 @@
+"""
+Chunk.update tick time with the spatial hash broadphase vs testing every
+mobile object against every other object
+
+Run from the repository root:
+    python -m benchmarks.collision_bench [n_ticks]
+
+NPCs and projectiles are stand-in entities with the same sizes and flags,
+moving in straight lines and bouncing off the chunk's edges, as the real
+ones need a GL context for their sprites. Collisions are only counted, so
+both loops see the same positions and must find the same pairs.
+"""
+import random
+import sys
+import time
+
+import pyglet
+pyglet.options['shadow_window'] = False
+
+import config
+from app.entities.base import Entity
+from app.entities.chunk import Chunk
+
+
+class Body(Entity):
+    attributes = {
+        'velocity_x': 0.0,
+        'velocity_y': 0.0,
+        'hits': 0,
+    }
+
+    def update(self):
+        self.x += self.velocity_x
+        self.y += self.velocity_y
+        if not 0 <= self.x <= config.window_width - self.width:
+            self.velocity_x = -self.velocity_x
+        if not 0 <= self.y <= config.window_height - self.height:
+            self.velocity_y = -self.velocity_y
+
+    def on_collision(self, entity):
+        self.hits += 1
+
+
+def body(size, speed, **kwargs):
+    return Body(x=random.uniform(0, config.window_width - size),
+                y=random.uniform(0, config.window_height - size),
+                width=size, height=size,
+                velocity_x=random.uniform(-speed, speed),
+                velocity_y=random.uniform(-speed, speed),
+                mobile=True, **kwargs)
+
+
+def populate(chunk, n_npcs, n_projectiles):
+    chunk.npcs = [body(50, 2, collidable=True) for _ in range(n_npcs)]
+    chunk.objects = [body(5, 10) for _ in range(n_projectiles)]
+
+
+def brute_force_update(chunk):
+    # Chunk.update before the spatial hash
+    for obj in chunk.game_objects:
+        obj.update()
+        if obj.mobile:
+            for other_obj in chunk.game_objects:
+                if other_obj is obj:
+                    pass
+                elif other_obj.collidable:
+                    if obj.collides_with(other_obj):
+                        obj.on_collision(other_obj)
+                        other_obj.on_collision(obj)
+
+
+def run(update, n_npcs, n_projectiles, n_ticks, seed):
+    random.seed(seed)
+    chunk = Chunk(0, 0)
+    populate(chunk, n_npcs, n_projectiles)
+    start = time.perf_counter()
+    for _ in range(n_ticks):
+        update(chunk)
+    tick_t = (time.perf_counter() - start)/n_ticks
+    return tick_t, sum(obj.hits for obj in chunk.game_objects)
+
+
+def main(n_ticks=60):
+    for n_npcs, n_projectiles in ((10, 10), (25, 25), (50, 50), (100, 100), (200, 200), (400, 400)):
+        brute_t, brute_hits = run(brute_force_update, n_npcs, n_projectiles, n_ticks, n_npcs)
+        hash_t, hash_hits = run(Chunk.update, n_npcs, n_projectiles, n_ticks, n_npcs)
+        assert hash_hits == brute_hits, (hash_hits, brute_hits)
+        print(f'{n_npcs:4d} npcs {n_projectiles:4d} projectiles  '
+              f'every pair {brute_t*1000:8.2f}ms/tick  spatial hash {hash_t*1000:6.2f}ms/tick  '
+              f'{hash_t/(n_npcs + n_projectiles)*1e6:5.1f}us/object  ({brute_t/hash_t:.0f}x)')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
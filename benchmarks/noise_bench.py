@@ -0,0 +1,69 @@
+"""
+Per-chunk terrain noise: np.vectorize(noise.pnoise2) vs app.system.perlin,
+and per-chunk vs region-batched generation
+
+Run from the repository root:
+    python -m benchmarks.noise_bench [n_chunks]
+
+Needs the `noise` package for the reference timings.
+"""
+import sys
+import time
+
+import numpy as np
+import noise
+import pyglet
+pyglet.options['shadow_window'] = False
+
+import config
+from app.entities.chunk import Chunk
+from app.system import terrain
+
+
+def reference_map(chunk, scale):
+    x_i = np.linspace(chunk.x*config.window_width,
+                      chunk.x*config.window_width + config.window_width - config.block_width,
+                      config.window_width//config.block_width).astype(int)
+    y_i = np.linspace(chunk.y*config.window_height,
+                      chunk.y*config.window_height + config.window_height - config.block_height,
+                      config.window_height//config.block_height).astype(int)
+    z_map_x, z_map_y = np.meshgrid(x_i, y_i)
+    return np.vectorize(noise.pnoise2)(z_map_x/scale,
+                                       z_map_y/scale,
+                                       octaves=6,
+                                       persistence=0.4,
+                                       lacunarity=2.0,
+                                       repeatx=config.window_width,
+                                       repeaty=config.window_height,
+                                       base=config.map_seed)*300
+
+
+def timed(func, chunks):
+    start = time.perf_counter()
+    results = [func(chunk) for chunk in chunks]
+    return (time.perf_counter() - start)/len(chunks), results
+
+
+def main(n_chunks=100):
+    side = int(np.ceil(np.sqrt(n_chunks)))
+    chunks = [Chunk(i % side - side//2, i//side - side//2) for i in range(n_chunks)]
+
+    ref_t, ref = timed(lambda c: (reference_map(c, 5000), reference_map(c, 10000)), chunks)
+    new_t, new = timed(lambda c: (c.gen_z_map(), c.gen_foliage_map()), chunks)
+
+    max_diff = max(np.abs(r - n).max() for ref_pair, new_pair in zip(ref, new)
+                                         for r, n in zip(ref_pair, new_pair))
+    print(f'chunks:           {n_chunks}')
+    print(f'noise.pnoise2:    {ref_t*1000:8.3f} ms/chunk')
+    print(f'perlin.pnoise2:   {new_t*1000:8.3f} ms/chunk')
+    print(f'speedup:          {ref_t/new_t:8.2f}x')
+    print(f'max abs diff:     {max_diff:.3g}')
+
+    start = time.perf_counter()
+    region = terrain.Region(-(side//2), -(side//2), side - side//2 - 1, side - side//2 - 1)
+    region_t = (time.perf_counter() - start)/len(region.coords)
+    print(f'region ({len(region.coords)} chunks): {region_t*1000:6.3f} ms/chunk')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
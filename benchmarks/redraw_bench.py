@@ -0,0 +1,75 @@
+"""
+Re-baking a chunk's image after Chunk.set_blocks edits a few blocks, just
+the box they change vs the whole image
+
+Run from the repository root:
+    python -m benchmarks.redraw_bench [n_edits]
+
+Chunks live in a MemoryChunkStore and nothing is written to disk. Each
+patched image is checked against a whole render of the edited terrain.
+"""
+import random
+import sys
+import time
+
+import pyglet
+pyglet.options['shadow_window'] = False
+
+from app import world
+from app.database import MemoryChunkStore
+from app.entities.chunk import Chunk
+from app.system.baking import bake_chunk
+from app.system.chunk_images import paste_pixels
+
+
+def edit(chunk, n_blocks):
+    # A square of blocks raised by one, as a single edit would
+    side = max(1, int(n_blocks**0.5))
+    row0 = random.randrange(chunk.n_rows - side + 1)
+    col0 = random.randrange(chunk.n_cols - side + 1)
+    cells = [(row, col) for row in range(row0, row0+side) for col in range(col0, col0+side)]
+    rows, cols = zip(*cells)
+    return cells, chunk.z_grid[list(rows), list(cols)] + 1
+
+
+def bake(chunk, box=None):
+    start = time.perf_counter()
+    baked = bake_chunk(chunk.x, chunk.y, chunk.z_grid, chunk.foliage_grid,
+                       chunk.lower_neighbour_z(), box)
+    return baked, time.perf_counter() - start
+
+
+def main(n_edits=10):
+    world.store = MemoryChunkStore()
+    chunk = Chunk(0, 0)
+    chunk.build_blocks()
+    chunk.save()
+    pixels = bake(chunk)[0].pixels
+
+    for n_blocks in (1, 4, 16, 64):
+        edit_t = box_t = whole_t = 0.0
+        for _ in range(n_edits):
+            # As if the chunk were shown, so set_blocks queues a box bake
+            chunk.sprite_key = chunk.img_key
+            cells, z = edit(chunk, n_blocks)
+            start = time.perf_counter()
+            chunk.set_blocks(cells, z=z)
+            edit_t += time.perf_counter() - start
+
+            future = world.baker.pending[chunk.coord][-1]
+            baked = future.result()
+            world.baker.completed()
+            assert baked.key == chunk.img_key
+            _, t = bake(chunk, baked.box)
+            box_t += t
+            whole, t = bake(chunk)
+            whole_t += t
+            pixels = paste_pixels(pixels, baked.box, baked.pixels)
+            assert pixels == whole.pixels
+        print(f'{n_blocks:3d} blocks  set_blocks {edit_t/n_edits*1000:6.2f}ms  '
+              f'box bake {box_t/n_edits*1000:7.2f}ms  whole bake {whole_t/n_edits*1000:7.2f}ms')
+    world.shutdown()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,116 @@
+"""
+Chunk save and load through app.database.region files vs packed rows in the
+SQLite models, plus the cost of compacting after chunks are rewritten
+
+Run from the repository root:
+    python -m benchmarks.region_bench [n_chunks]
+
+Works in a temporary directory, db.sqlite and config.region_dir are not
+touched.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pyglet
+pyglet.options['shadow_window'] = False
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.database import models
+from app.database.packing import pack_terrain, unpack_terrain
+from app.database.region import RegionStore, SECTOR
+from app.system import terrain
+
+
+def fields(coords):
+    region = terrain.Region(min(x for x, _ in coords), min(y for _, y in coords),
+                            max(x for x, _ in coords), max(y for _, y in coords))
+    return {coord: terrain.bound_fields(*region.fields(*coord)) for coord in coords}
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_sqlite(tmp, grids, lookups):
+    engine = create_engine(f'sqlite:///{os.path.join(tmp, "bench.sqlite")}')
+    event.listen(engine, 'connect', models.set_sqlite_pragmas)
+    models.Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    def save():
+        db_objs = {}
+        for (x, y), (z_grid, foliage_grid) in grids.items():
+            db_obj = models.Chunk(x=x, y=y, name=f'Chunk({x}, {y})',
+                                  terrain=pack_terrain(z_grid, foliage_grid))
+            session.add(db_obj)
+            session.flush()
+            db_objs[(x, y)] = db_obj.id
+        session.commit()
+        return db_objs
+
+    def load(ids):
+        for coord in lookups:
+            unpack_terrain(session.query(models.Chunk).populate_existing()
+                                  .get(ids[coord]).terrain)
+
+    save_time, ids = timed(save)
+    load_time, _ = timed(load, ids)
+    session.close()
+    engine.dispose()
+    return save_time, load_time, os.path.getsize(os.path.join(tmp, 'bench.sqlite'))
+
+
+def bench_region(tmp, grids, lookups):
+    store = RegionStore(os.path.join(tmp, 'regions'))
+
+    def save(grids):
+        for (x, y), (z_grid, foliage_grid) in grids.items():
+            store.save(x, y, z_grid, foliage_grid)
+
+    def load():
+        for coord in lookups:
+            store.load(*coord)
+
+    save_time, _ = timed(save, grids)
+    load_time, _ = timed(load)
+    # Rewrite half the chunks with the other half's terrain, so they change
+    # size and leave freed sectors behind
+    coords = list(grids)
+    rewrites = dict(zip(coords[::2], (grids[coord] for coord in coords[1::2])))
+    save(rewrites)
+    free = sum(region.free_sectors for region in store.regions.values())
+    compact_time, freed = timed(store.compact)
+    size = sum(os.path.getsize(region.path) for region in store.regions.values())
+    store.close()
+    return save_time, load_time, size, free, compact_time, freed
+
+
+def main():
+    n_chunks = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    side = int(n_chunks**0.5)
+    coords = [(x, y) for x in range(side) for y in range(side)]
+    print(f'Generating {len(coords)} chunks')
+    grids = fields(coords)
+    lookups = [random.choice(coords) for _ in range(2000)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        save_time, load_time, size = bench_sqlite(tmp, grids, lookups)
+        print(f'sqlite  save {save_time/len(coords)*1000:.3f}ms/chunk  '
+              f'load {load_time/len(lookups)*1000:.3f}ms/chunk  {size/1024:.0f}KB')
+
+        save_time, load_time, size, free, compact_time, freed = bench_region(tmp, grids, lookups)
+        print(f'region  save {save_time/len(coords)*1000:.3f}ms/chunk  '
+              f'load {load_time/len(lookups)*1000:.3f}ms/chunk  {size/1024:.0f}KB after compaction')
+        print(f'        {free} free sectors after rewriting {len(coords)//2} chunks, '
+              f'compacted in {compact_time*1000:.1f}ms freeing {freed*SECTOR//1024}KB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Chunk lookup and load latency against a populated database, with SQLite's
+default settings and separate x and y indexes vs config.sqlite_pragmas, the
+composite (x, y) index and the coordinate catalog
+
+Run from the repository root:
+    python -m benchmarks.storage_bench [n_chunks]
+
+Builds its databases in a temporary directory, db.sqlite is not touched.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pyglet
+pyglet.options['shadow_window'] = False
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.database import models
+from app.database.packing import pack_terrain, unpack_terrain
+from app.system import terrain
+
+
+def build_db(path, n_chunks, tuned):
+    engine = create_engine(f'sqlite:///{path}')
+    if tuned:
+        event.listen(engine, 'connect', models.set_sqlite_pragmas)
+    models.Base.metadata.create_all(engine)
+    if not tuned:
+        # The schema as it was: one index per coordinate
+        engine.execute('DROP INDEX ix_chunks_x_y')
+        engine.execute('CREATE INDEX ix_chunks_x ON chunks (x)')
+        engine.execute('CREATE INDEX ix_chunks_y ON chunks (y)')
+
+    side = int(n_chunks**0.5)
+    blob = pack_terrain(*terrain.bound_fields(*terrain.gen_chunk_fields(0, 0)))
+    chunks = models.Chunk.__table__
+    engine.execute(chunks.insert(), [{'x': x, 'y': y, 'name': f'Chunk({x}, {y})', 'terrain': blob}
+                                     for x in range(side) for y in range(side)])
+    return engine, side
+
+
+def time_per_call(f, coords):
+    start = time.perf_counter()
+    for coord in coords:
+        f(*coord)
+    return (time.perf_counter() - start)/len(coords)*1000
+
+
+def bench(n_chunks, tuned):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, side = build_db(os.path.join(tmp, 'bench.sqlite'), n_chunks, tuned)
+        session = sessionmaker(bind=engine)()
+        # Half existing chunks, half just past the edge of the world
+        coords = [(random.randrange(side), random.randrange(side)) for _ in range(1000)] + \
+                 [(side + random.randrange(side), random.randrange(side)) for _ in range(1000)]
+        random.shuffle(coords)
+
+        if tuned:
+            start = time.perf_counter()
+            ids = {(x, y): id for id, x, y in
+                   session.query(models.Chunk.id, models.Chunk.x, models.Chunk.y)}
+            catalog_ms = (time.perf_counter() - start)*1000
+
+            def exists(x, y):
+                return (x, y) in ids
+
+            def load(x, y):
+                id = ids.get((x, y))
+                if id is not None:
+                    db_obj = session.query(models.Chunk).populate_existing().get(id)
+                    unpack_terrain(db_obj.terrain)
+        else:
+            catalog_ms = None
+
+            def exists(x, y):
+                return session.query(models.Chunk.id).filter_by(x=x, y=y).first() is not None
+
+            def load(x, y):
+                db_obj = session.query(models.Chunk).populate_existing() \
+                                .filter_by(x=x, y=y).first()
+                if db_obj is not None:
+                    unpack_terrain(db_obj.terrain)
+
+        results = (time_per_call(exists, coords), time_per_call(load, coords), catalog_ms)
+        session.close()
+        engine.dispose()
+        return results
+
+
+def main():
+    n_chunks = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print(f'{n_chunks} chunks, 2000 lookups (half missing)')
+    for tuned in (False, True):
+        exists_ms, load_ms, catalog_ms = bench(n_chunks, tuned)
+        label = 'tuned  ' if tuned else 'default'
+        print(f'{label} exists {exists_ms:.4f}ms  load {load_ms:.4f}ms' +
+              (f'  (catalog built in {catalog_ms:.1f}ms)' if catalog_ms is not None else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Chunk generation cost vs save and load cost through each ChunkStore
+
+Run from the repository root:
+    python -m benchmarks.store_bench [n_chunks]
+
+The sqlite and region stores work in a temporary directory, db.sqlite and
+config.region_dir are not touched.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pyglet
+pyglet.options['shadow_window'] = False
+
+from app.database import MemoryChunkStore, RegionChunkStore, SqliteChunkStore
+from app.system import terrain
+
+
+def stores(tmp):
+    yield 'memory', MemoryChunkStore()
+    yield 'sqlite', SqliteChunkStore(f'sqlite:///{os.path.join(tmp, "bench.sqlite")}')
+    yield 'region', RegionChunkStore(os.path.join(tmp, 'regions'))
+
+
+def main(n_chunks=400):
+    side = int(n_chunks**0.5)
+    coords = [(x, y) for x in range(side) for y in range(side)]
+
+    start = time.perf_counter()
+    grids = {coord: terrain.bound_fields(*terrain.gen_chunk_fields(*coord)) for coord in coords}
+    generate_t = (time.perf_counter() - start)/len(coords)
+    print(f'{len(coords)} chunks, generation {generate_t*1000:.3f}ms/chunk')
+
+    lookups = [random.choice(coords) for _ in range(1000)]
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, store in stores(tmp):
+            start = time.perf_counter()
+            for (x, y), (z_grid, foliage_grid) in grids.items():
+                store.save(x, y, f'Chunk({x}, {y})', z_grid, foliage_grid)
+            queue_t = (time.perf_counter() - start)/len(coords)
+            store.flush()
+            save_t = (time.perf_counter() - start)/len(coords)
+
+            start = time.perf_counter()
+            for coord in lookups:
+                store.load(*coord)
+            load_t = (time.perf_counter() - start)/len(lookups)
+            store.close()
+            print(f'{name:8s} save {queue_t*1000:.3f}ms/chunk on the caller, '
+                  f'{save_t*1000:.3f}ms/chunk flushed  load {load_t*1000:.3f}ms/chunk')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -12,5 +12,33 @@ sand_level = 2
 grass_level = 25
 snow_level = 90
 chunk_in_memory_distance = 2
+warm_cache_bytes = 64*1024*1024 # unloaded chunks kept in memory, see app.system.warm_cache
 sprint_modifier = 1.5
-map_seed = 7
\ No newline at end of file
+collision_cell = 100 # px, see app.system.spatial_hash
+map_seed = 7
+generation_workers = 4
+bake_workers = 2 # processes baking chunk images, see app.system.baking
+prefetch_distance = 1
+tile_cache_dir = 'app/assets/tiles'
+chunk_img_format = 'atlas' # or 'png', see app.system.chunk_images
+chunk_img_dir = 'app/assets/chunks'
+atlas_dir = 'app/assets/atlas'
+atlas_compression = 'raw' # or 'zlib', see app.system.atlas
+overview_fill_rate = 2 # stored chunks drawn into the overview per tick
+minimap_level = 2 # overview pixels are 2**level blocks wide, see app.system.overview
+minimap_width = 250
+minimap_height = 140
+minimap_margin = 10
+minimap_opacity = 200
+chunk_storage = 'packed' # or 'rows', one models.Block row per block
+chunk_backend = 'sqlite' # or 'region' or 'memory', see app.database.store
+database_url = 'sqlite:///db.sqlite'
+region_dir = 'regions'
+persist_interval = 1.0 # seconds between write-behind commits
+sqlite_pragmas = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL', # WAL stays consistent, only the last commits can be lost
+    'cache_size': -64000, # KiB
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
\ No newline at end of file
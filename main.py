@@ -7,5 +7,7 @@ def main():
     window = world.get_window()
     pyglet.clock.schedule_interval(world.update, 1/120.0)
     pyglet.app.run()
+    world.shutdown()
 
-main()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Converts chunks stored as one blocks row per block into packed terrain blobs
+
+    python migrate.py --batch 50 --vacuum
+
+Each chunk's blob is written and its block rows deleted in the same
+transaction, so an interrupted run can simply be started again.
+"""
+import argparse
+import time
+
+import pyglet
+pyglet.options['shadow_window'] = False
+
+import config
+from app.database import SqliteChunkStore, models
+from app.database.packing import pack_terrain
+
+
+def migrate(store, batch):
+    session = store.session
+    db_objs = session.query(models.Chunk).filter(models.Chunk.terrain.is_(None)) \
+                                         .order_by(models.Chunk.id).all()
+    print(f'{len(db_objs)} chunks to pack')
+    blocks = models.Block.__table__
+    start = time.perf_counter()
+
+    for i, db_obj in enumerate(db_objs, 1):
+        # Written directly rather than through the store's save so this
+        # works whatever config.chunk_storage is set to
+        db_obj.terrain = pack_terrain(*store.read_block_rows(session, db_obj.id))
+        session.execute(blocks.delete().where(blocks.c.chunk_id == db_obj.id))
+        if i % batch == 0 or i == len(db_objs):
+            session.commit()
+            rate = i/(time.perf_counter() - start)
+            print(f'[{i}/{len(db_objs)}] packed ({rate:.2f} chunks/s)')
+
+
+def vacuum(store):
+    # Deleted rows only give their pages back to the file on a VACUUM
+    store.session.remove()
+    with store.engine.connect() as connection:
+        connection.execute('VACUUM')
+    print('Vacuumed database')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--database', default=config.database_url,
+                        help='database url, by default config.database_url')
+    parser.add_argument('--batch', type=int, default=50, help='chunks per commit')
+    parser.add_argument('--vacuum', action='store_true',
+                        help='reclaim the space freed by the deleted block rows')
+    args = parser.parse_args()
+    store = SqliteChunkStore(args.database)
+    migrate(store, args.batch)
+    if args.vacuum:
+        vacuum(store)
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
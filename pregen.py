@@ -0,0 +1,114 @@
+"""
+Pregenerates chunks around a point without opening a window
+
+    python pregen.py --x 0 --y 0 --radius 10 --workers 4 --gc
+
+Chunks already in the database with an up to date image are skipped, so an
+interrupted run can simply be started again. --gc then removes the images
+no stored chunk uses any more.
+"""
+import argparse
+import os
+import time
+
+import pyglet
+pyglet.options['shadow_window'] = False
+
+from app import world
+from app.entities.chunk import Chunk
+from app.system.chunk_images import live_keys
+from app.system.generation import ChunkGenerationService
+from app.system.utils import Coord, distance
+
+
+# Chunk rows generated per batched terrain pass without workers
+BAND_ROWS = 8
+
+
+def chunks_in_radius(x, y, radius):
+    coords = [Coord(x+dx, y+dy) for dx in range(-radius, radius+1)
+                                for dy in range(-radius, radius+1)
+              if distance(x, y, x+dx, y+dy) <= radius]
+    return sorted(coords, key=lambda coord: distance(x, y, *coord))
+
+
+class Progress:
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.start = time.perf_counter()
+
+    def step(self, chunk, action):
+        self.done += 1
+        rate = self.done/(time.perf_counter() - self.start)
+        print(f'[{self.done}/{self.total}] {action} {chunk.name} ({rate:.2f} chunks/s)')
+
+
+def pregenerate(x, y, radius, workers):
+    coords = chunks_in_radius(x, y, radius)
+    existing = world.store.existing(coords)
+    missing = [coord for coord in coords if coord not in existing]
+    # Images are written after the chunk's save is queued, so a row
+    # without an image is what an interrupted run can leave behind. So is
+    # a change to the terrain or the renderer, which changes the image key.
+    stored = [Chunk.load_stored(*coord) for coord in existing]
+    unbaked = [chunk for chunk in stored if not chunk.has_img()]
+
+    print(f'{len(coords)} chunks in radius {radius} of ({x}, {y}): '
+          f'{len(missing)} to generate, {len(unbaked)} to bake, '
+          f'{len(coords) - len(missing) - len(unbaked)} already done')
+    progress = Progress(len(missing) + len(unbaked))
+
+    for chunk in unbaked:
+        chunk.build_img()
+        progress.step(chunk, 'baked')
+
+    if workers > 0:
+        generator = ChunkGenerationService(workers)
+        for coord in missing:
+            generator.submit(*coord)
+        try:
+            for generated in generator.as_completed():
+                progress.step(Chunk.from_generated(generated), 'generated')
+        finally:
+            generator.shutdown(wait=False)
+    else:
+        for y0 in range(y-radius, y+radius+1, BAND_ROWS):
+            band = Chunk.generate_region(x-radius, y0, x+radius,
+                                         min(y0+BAND_ROWS-1, y+radius), missing)
+            for chunk in band:
+                chunk.build_img()
+                progress.step(chunk, 'generated')
+
+    world.store.flush()
+    world.img_writer.flush()
+    elapsed = time.perf_counter() - progress.start
+    if progress.done:
+        print(f'{progress.done} chunks in {elapsed:.1f}s '
+              f'({progress.done/elapsed:.2f} chunks/s)')
+
+
+def remove_orphans():
+    world.img_writer.flush()
+    removed = world.images.collect_garbage(live_keys(world.store))
+    print(f'{removed} orphaned images removed')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--x', type=int, default=0, help='center chunk x')
+    parser.add_argument('--y', type=int, default=0, help='center chunk y')
+    parser.add_argument('--radius', type=int, default=5, help='radius in chunks')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='worker processes, 0 to generate in this process')
+    parser.add_argument('--gc', action='store_true',
+                        help='remove images no stored chunk uses afterwards')
+    args = parser.parse_args()
+    pregenerate(args.x, args.y, args.radius, args.workers)
+    if args.gc:
+        remove_orphans()
+
+
+if __name__ == '__main__':
+    main()